@@ -1,6 +1,15 @@
 # Author: Joseph Doiron (Obviously)
 # Date: 3/11/2021
 
+import functools
+import pickle
+import random
+import time
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 
 class SpaceError(Exception):
     """Exception used when a space error occurs"""
@@ -10,53 +19,243 @@ class CommitError(Exception):
     """exception used when a move revert is made before commit is called for a Move object"""
     pass
 
+class FenError(Exception):
+    """Exception used when a FEN string can't be read or describes an impossible position"""
+    pass
 
-class SpaceSequence:
-    """Helper class that is suppose to mimic Piece.get_[direction]_space() so a known list of spaces can be used
-    in get_moves_in_direction().
-
-    e.g.
-    ------------------------------------
-    sq = SpaceSequence(["a1", "a2", "a3"])
-    sq.get_next() -> "a1"
-    sq.get_next() - "a1"
-    sq.get_next("a1") -> "a2"
-    """
-
-    def __init__(self, spaces: list):
-        self.spaces = spaces
 
-    def get_next(self, space: str = None):
-        """Returns the first space unless another space is given.
-        Args:
-            space: str
-        Returns: str
-            If nothing is passed, this will return the first space in the list. If a space is passed, it will return
-            the next space in the list. "00" is returned if a space is passed that isn't in the list.
-        """
-        if space is None:
-            return self.spaces[0]
-        spaces = self.spaces
-        try:
-            return spaces[spaces.index(space)+1]
-        except ValueError:
-            return "00"
-        except IndexError:
-            return "00"
+# Spaces are stored as integers: index = (row - 1) * 9 + column, so "a1" is 0 and "i10" is 89. Algebraic names
+# only exist at the JanggiGame boundary. OFF_BOARD is a sentinel space every step off the edge lands on.
+COLUMNS = "abcdefghi"
+ROWS = 10
+COLS = 9
+OFF_BOARD = ROWS * COLS
+SPACE_NAMES = tuple(col + str(row) for row in range(1, ROWS + 1) for col in COLUMNS)
+_SPACE_INDEXES = {name: index for index, name in enumerate(SPACE_NAMES)}
+class _Border:
+    """The type of _BORDER. It pickles by name, so a board sent to another process still holds the one _BORDER"""
+
+    def __reduce__(self):
+        return "_BORDER"
+
+
+# occupies the OFF_BOARD slot of Board.spaces; it is neither open nor a piece
+_BORDER = _Border()
+
+
+def space_index(space: str):
+    """Converts an algebraic space (e.g. "e9") to its board index. Raises SpaceError if the space isn't valid
+    Args:
+        space: str
+    Returns: int"""
+    try:
+        return _SPACE_INDEXES[space]
+    except (KeyError, TypeError):
+        raise SpaceError(f"{space} is not a valid space")
+
+
+def space_name(space: int):
+    """Converts a board index back to its algebraic name.
+    Args:
+        space: int
+    Returns: str"""
+    return SPACE_NAMES[space]
+
+
+def parse_move(text: str):
+    """Reads a move written as two algebraic spaces, "c7 c6", "c7-c6" or "c7c6" (the same space twice passes).
+    Returns None for a blank line. Raises SpaceError if the text isn't two valid spaces
+    Args:
+        text: str
+    Returns: (str, str) | None"""
+    parts = text.replace("-", " ").split()
+    if len(parts) == 1:
+        word = parts[0]
+        # the second space starts at the first letter after the first one
+        for split in range(1, len(word)):
+            if word[split].isalpha():
+                parts = [word[:split], word[split:]]
+                break
+    elif not parts:
+        return None
+    if len(parts) != 2 or parts[0] not in _SPACE_INDEXES or parts[1] not in _SPACE_INDEXES:
+        raise SpaceError(f"{text.strip()!r} is not a move")
+    return parts[0], parts[1]
+
+
+def _offset_space(space: int, col_step: int, row_step: int):
+    """Returns the space col_step columns and row_step rows away from space, or OFF_BOARD. Only used to build the
+    geometry tables below."""
+    if space == OFF_BOARD:
+        return OFF_BOARD
+    row, col = divmod(space, COLS)
+    row += row_step
+    col += col_step
+    if 0 <= row < ROWS and 0 <= col < COLS:
+        return row * COLS + col
+    return OFF_BOARD
+
+
+# Geometry tables, built once at import so move generation never does coordinate arithmetic. Every table has an
+# entry for OFF_BOARD too, so chained lookups that walk off the edge stay on OFF_BOARD.
+#
+# NEIGHBORS[space][direction] uses absolute directions ("top" is towards row 1, like Board.get_top_space).
+TOP, BOTTOM, LEFT, RIGHT, TOP_RIGHT, TOP_LEFT, BOTTOM_RIGHT, BOTTOM_LEFT = range(8)
+_DIRECTION_STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0), (1, -1), (-1, -1), (1, 1), (-1, 1))
+NEIGHBORS = tuple(
+    tuple(_offset_space(space, col_step, row_step) for col_step, row_step in _DIRECTION_STEPS)
+    for space in range(OFF_BOARD + 1)
+)
+
+# ORIENTED_NEIGHBORS[color][space][direction] uses directions relative to the side: blue moves towards row 1 and red
+# towards row 10, so a red piece's "left" is the board's right.
+FORWARD, BACKWARD, TO_LEFT, TO_RIGHT, FORWARD_RIGHT, FORWARD_LEFT, BACKWARD_RIGHT, BACKWARD_LEFT = range(8)
+_ORIENTATIONS = {
+    "blue": (TOP, BOTTOM, LEFT, RIGHT, TOP_RIGHT, TOP_LEFT, BOTTOM_RIGHT, BOTTOM_LEFT),
+    "red": (BOTTOM, TOP, RIGHT, LEFT, BOTTOM_LEFT, BOTTOM_RIGHT, TOP_LEFT, TOP_RIGHT),
+}
+ORIENTED_NEIGHBORS = {
+    color: tuple(tuple(neighbors[direction] for direction in orientation) for neighbors in NEIGHBORS)
+    for color, orientation in _ORIENTATIONS.items()
+}
+
+# ORTHOGONAL_RAYS[space] is a tuple of rays (top, bottom, left, right), each listing the spaces from the nearest
+# one out to the edge.
+def _ray(space: int, direction: int):
+    spaces = []
+    space = NEIGHBORS[space][direction]
+    while space != OFF_BOARD:
+        spaces.append(space)
+        space = NEIGHBORS[space][direction]
+    return tuple(spaces)
+
+ORTHOGONAL_RAYS = tuple(
+    tuple(_ray(space, direction) for direction in (TOP, BOTTOM, LEFT, RIGHT)) if space != OFF_BOARD else ()
+    for space in range(OFF_BOARD + 1)
+)
+
+FORTRESS_SPACES = {
+    "red": frozenset(_SPACE_INDEXES[space] for space in ["d1", "d2", "d3", "e1", "e2", "e3", "f1", "f2", "f3"]),
+    "blue": frozenset(_SPACE_INDEXES[space] for space in ["d8", "d9", "d10", "e8", "e9", "e10", "f8", "f9", "f10"]),
+}
+
+# PALACE_RAYS[space] holds the rays along the fortress diagonals: a corner has one ray (center, opposite corner) and
+# the center has four rays of a single corner each. Every other space has none.
+_PALACE_DIAGONALS = [tuple(_SPACE_INDEXES[space] for space in line) for line in [
+    ("d1", "e2", "f3"), ("f1", "e2", "d3"), ("d8", "e9", "f10"), ("f8", "e9", "d10"),
+]]
+
+def _palace_rays(space: int):
+    rays = []
+    for line in _PALACE_DIAGONALS:
+        if space in line:
+            position = line.index(space)
+            if position < 2:
+                rays.append(line[position + 1:])
+            if position > 0:
+                rays.append(line[position - 1::-1])
+    return tuple(rays)
+
+PALACE_RAYS = tuple(_palace_rays(space) for space in range(OFF_BOARD + 1))
+
+# FORTRESS_STEPS[space] are the spaces a general or guard can step to: orthogonal neighbors inside the same fortress
+# plus the next space along a fortress diagonal.
+def _fortress_steps(space: int):
+    for fortress in FORTRESS_SPACES.values():
+        if space in fortress:
+            steps = [NEIGHBORS[space][direction] for direction in (TOP, BOTTOM, LEFT, RIGHT)]
+            steps = [step for step in steps if step in fortress]
+            return tuple(steps + [ray[0] for ray in PALACE_RAYS[space]])
+    return ()
+
+FORTRESS_STEPS = tuple(_fortress_steps(space) for space in range(OFF_BOARD + 1))
+
+# HORSE_PATHS[space] is a tuple of (leg, destination) and ELEPHANT_PATHS[space] a tuple of (leg, leg, destination).
+# The leg spaces must be open for the move; paths that leave the board are left out.
+def _paths(space: int, orthogonal_steps: int):
+    paths = []
+    for direction, diagonals in ((TOP, (TOP_LEFT, TOP_RIGHT)), (BOTTOM, (BOTTOM_LEFT, BOTTOM_RIGHT)),
+                                 (LEFT, (TOP_LEFT, BOTTOM_LEFT)), (RIGHT, (TOP_RIGHT, BOTTOM_RIGHT))):
+        leg = NEIGHBORS[space][direction]
+        for diagonal in diagonals:
+            path = [leg]
+            for _ in range(orthogonal_steps):
+                path.append(NEIGHBORS[path[-1]][diagonal])
+            if OFF_BOARD not in path:
+                paths.append(tuple(path))
+    return tuple(paths)
+
+HORSE_PATHS = tuple(_paths(space, 1) for space in range(OFF_BOARD + 1))
+ELEPHANT_PATHS = tuple(_paths(space, 2) for space in range(OFF_BOARD + 1))
+
+# SOLDIER_STEPS[color][space]: forward, left and right, plus the forward fortress diagonals.
+def _soldier_steps(color: str, space: int):
+    neighbors = ORIENTED_NEIGHBORS[color][space]
+    steps = [neighbors[FORWARD], neighbors[TO_LEFT], neighbors[TO_RIGHT]]
+    steps += [ray[0] for ray in PALACE_RAYS[space] if ray[0] in (neighbors[FORWARD_LEFT], neighbors[FORWARD_RIGHT])]
+    return tuple(step for step in steps if step != OFF_BOARD)
+
+SOLDIER_STEPS = {
+    color: tuple(_soldier_steps(color, space) for space in range(OFF_BOARD + 1)) for color in ("blue", "red")
+}
+
+# Reverse tables for Board.attackers_of: which spaces a piece would have to stand on to attack a space.
+# HORSE_ATTACKERS[space] is a tuple of (leg, origin), ELEPHANT_ATTACKERS[space] of (leg, leg, origin) and
+# SOLDIER_ATTACKERS[color][space] of origins. Fortress steps are symmetric, so FORTRESS_STEPS serves guards as is.
+def _reverse_paths(paths_table):
+    reverse = [[] for _ in range(OFF_BOARD + 1)]
+    for origin, paths in enumerate(paths_table):
+        for path in paths:
+            reverse[path[-1]].append(path[:-1] + (origin,))
+    return tuple(tuple(paths) for paths in reverse)
+
+HORSE_ATTACKERS = _reverse_paths(HORSE_PATHS)
+ELEPHANT_ATTACKERS = _reverse_paths(ELEPHANT_PATHS)
+SOLDIER_ATTACKERS = {
+    color: tuple(tuple(path[0] for path in paths) for paths in _reverse_paths(tuple((step,) for step in steps) for steps in SOLDIER_STEPS[color]))
+    for color in SOLDIER_STEPS
+}
+
+OPPONENT = {"blue": "red", "red": "blue"}
+
+# Moves are encoded as small ints: curr_space * 90 + new_space, which fits in the 13 bits of MOVE_MASK. A move from a
+# space to itself is a pass, PASS_MOVE is the canonical one.
+MOVE_MASK = (1 << 13) - 1
+PASS_MOVE = 0
+_UNDO_STACK_SIZE = 1024
+
+
+def encode_move(curr_space: int, new_space: int):
+    """Encodes a move as an int (see Board.make)
+    Args:
+        curr_space: int
+        new_space: int
+    Returns: int"""
+    return curr_space * OFF_BOARD + new_space
+
+
+def decode_move(move: int):
+    """Returns the (curr_space, new_space) of an encoded move
+    Args:
+        move: int
+    Returns: tuple"""
+    return divmod(move & MOVE_MASK, OFF_BOARD)
 
 
 class Move:
-    """Helper class that represents a move on the board."""
+    """Helper class that represents a move on the board. It's a thin wrapper around Board.make/Board.unmake, so
+    committed moves have to be reverted in the reverse order they were committed in."""
 
     def __init__(self, curr_space, new_space, board):
         """Args:
-            curr_space: str
-            new_space: str
+            curr_space: int
+            new_space: int
             board: JanggiBoard.Board
         """
         self._board = board
         self._curr_space = curr_space
         self._new_space = new_space
+        self._move = encode_move(curr_space, new_space)
         self._piece = board.get_piece(curr_space)
         self._captured_piece = board.get_piece(new_space)
         self._commited = False
@@ -65,56 +264,26 @@ class Move:
         """Commits the move to the board
         Returns: None
         """
-        if self._board.has_opponent_piece(self._new_space, self._piece.color):
-            self._board.remove_piece(self._new_space)
-        self._piece.change_space(self._new_space)
+        self._board.make(self._move)
         self._commited = True
 
     def revert(self):
         """Reverts the move if it was committed"""
-        if self._commited:
-            self._piece.change_space(self._curr_space)
-            if self._captured_piece is not None:
-                self._board.add_piece(self._new_space, self._captured_piece)
-        else:
+        if not self._commited:
             raise CommitError("move must be committed first")
-
-
-class Space:
-    """Helper class for space manipulation"""
-    
-    def __new__(cls, space: str = None):
-        """If space is None an instance will not be created and None is returned"""
-        if space is None:
-            return None
-        return super().__new__(cls) 
-         
-    def __init__(self, space:str):
-        """Args:
-            space:  str
-        """
-        self._col, self._row = ord(space[0]), int(space[1:])
-        
-    def __str__(self):
-        return chr(self.col)+str(self.row)
-        
-    @property
-    def row(self):
-        """Returns: int"""
-        return self._row
-    
-    @property
-    def col(self):
-        """Returns: int"""
-        return self._col
+        if self._board.last_move() != self._move:
+            raise CommitError("moves must be reverted in the reverse order they were committed in")
+        self._board.unmake()
+        self._commited = False
 
 
 class Piece:
 
-    def __init__(self, color: str = None, space: str = None, board: 'Board' = None):
+    def __init__(self, color: str = None, space: int = None, board: 'Board' = None):
         self._color = color
-        self._space = Space(space)
+        self._space = space
         self._board = board
+        self._neighbors = ORIENTED_NEIGHBORS.get(color)
         if space is not None and board is not None:
             board.place_piece(self, space)
 
@@ -126,188 +295,180 @@ class Piece:
 
     @property
     def space(self):
-        return str(self._space)
+        return self._space
 
     @property
     def row(self):
-        return self._space.row
+        return self._space // COLS + 1
 
     @property
     def col(self):
-        return self._space.col
+        return self._space % COLS
 
     @property
     def color(self):
         return self._color
 
-    def get_forward_space(self, starting_space: str = None):
+    def get_forward_space(self, starting_space: int = None):
         """Returns the space in front (forward) of the piece. This method can also be used in a loop to get more spaces.
         Args:
-            starting_space: str
+            starting_space: int
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_top_space(space)
-        return self._board.get_bottom_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][FORWARD]
 
-    def get_right_space(self, starting_space: str = None):
+    def get_right_space(self, starting_space: int = None):
         """Returns the space to the right of the piece. This method can also be used in a loop to get more spaces.
         Args:
-            starting_space: str
+            starting_space: int
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_right_space(space)
-        return self._board.get_left_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][TO_RIGHT]
 
-    def get_left_space(self, starting_space: str = None):
+    def get_left_space(self, starting_space: int = None):
         """Returns the space to the left of the piece. This method can also be used in a loop to get more spaces.
         Args:
             starting_space:
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_left_space(space)
-        return self._board.get_right_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][TO_LEFT]
 
-    def get_backward_space(self, starting_space: str = None):
+    def get_backward_space(self, starting_space: int = None):
         """Returns the space to behind the piece. This method can also be used in a loop to get more spaces.
         Args:
-            starting_space: str
+            starting_space: int
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_bottom_space(space)
-        return self._board.get_top_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][BACKWARD]
 
-    def get_diagonal_forward_right(self, starting_space: str = None):
+    def get_diagonal_forward_right(self, starting_space: int = None):
         """Returns a diagonal space. This method can also be used in a loop to get more spaces.
         Args:
             starting_space:
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_top_right_space(space)
-        return self._board.get_bottom_left_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][FORWARD_RIGHT]
 
-    def get_diagonal_forward_left(self, starting_space: str = None):
+    def get_diagonal_forward_left(self, starting_space: int = None):
         """Returns a diagonal space. This method can also be used in a loop to get more spaces.
         Args:
             starting_space:
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_top_left_space(space)
-        return self._board.get_bottom_right_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][FORWARD_LEFT]
 
-    def get_diagonal_backward_right(self, starting_space: str = None):
+    def get_diagonal_backward_right(self, starting_space: int = None):
         """Returns a diagonal space. This method can also be used in a loop to get more spaces.
         Args:
             starting_space:
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_bottom_right_space(space)
-        return self._board.get_top_left_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][BACKWARD_RIGHT]
 
-    def get_diagonal_backward_left(self, starting_space: str = None):
+    def get_diagonal_backward_left(self, starting_space: int = None):
         """Returns a diagonal space. This method can also be used in a loop to get more spaces.
         Args:
             starting_space:
                 the starting space to use
-        Returns: str"""
-        space = starting_space or self.space
-        if self.color == "blue":
-            return self._board.get_bottom_left_space(space)
-        return self._board.get_top_right_space(space)
+        Returns: int"""
+        space = self.space if starting_space is None else starting_space
+        return self._neighbors[space][BACKWARD_LEFT]
 
     def in_fortress(self):
         """Returns True if the piece is in a fortress
         Returns: True | False"""
-        if self.space in self._board.fortress_spaces:
-            return True
-        return False
+        return self._space in self._board.fortress_spaces
 
-    def change_space(self, new_space: str):
+    def change_space(self, new_space: int):
         """Changes the pieces space on the board
         Args:
-            new_space: str
+            new_space: int
         Returns: None"""
         self._board.move_piece(self, new_space)
         self._space = new_space
 
-    def move(self, new_space: str):
+    def move(self, new_space: int):
         """Creates a janggiGame.Move object to later be commited/reverted
         Args:
-            new_space: str
+            new_space: int
         Returns: JanggiGame.Move"""
         return Move(self.space, new_space, self._board)
 
 class Board:
 
-    def __init__(self):
-        self.spaces = {col + str(row): None for col in "abcdefghi" for row in range(1, 11)}
-        self.blue_fortress_spaces = ["d8", "d9", "d10", "e8", "e9", "e10", "f8", "f9", "f10"]
-        self.red_fortress_spaces = ["d1", "d2", "d3", "e1", "e2", "e3", "f1", "f2", "f3"]
-        self.pieces = {
-                "blue": {
-                    "general": General("blue", "e9", self), 
-                    "other-pieces": [
-                        Chariot("blue", "a10", self), Chariot("blue", "i10", self), Elephant("blue", "b10", self), Elephant("blue", "g10", self),
-                        Horse("blue", "c10", self), Horse("blue", "h10", self), Cannon("blue", "b8", self), Cannon("blue", "h8", self),
-                        Guard("blue", "d10", self), Guard("blue", "f10", self), Soldier("blue", "a7", self), Soldier("blue", "c7", self), 
-                        Soldier("blue", "e7", self), Soldier("blue", "g7", self), Soldier("blue", "i7", self)
-                        ]
-                },
-                "red": {
-                    "general": General("red", "e2", self), 
-                    "other-pieces":[
-                        Chariot("red", "a1", self), Chariot("red", "i1", self), Elephant("red", "b1", self), Elephant("red", "g1", self),
-                        Horse("red", "c1", self), Horse("red", "h1", self), Cannon("red", "b3", self), Cannon("red", "h3", self),
-                        Guard("red", "d1", self), Guard("red", "f1", self), Soldier("red", "a4", self), Soldier("red", "c4", self), 
-                        Soldier("red", "e4", self), Soldier("red", "g4", self), Soldier("red", "i4", self)
-                        ]
-                }
-            }
+    def __init__(self, setup=None):
+        """Args:
+            setup: iterable of (piece class, color, space) | None
+                the pieces to start with instead of START_SETUP, each color with exactly one General (see parse_fen)
+        """
+        # one slot per space plus the OFF_BOARD sentinel, so looking up a space that fell off the edge never needs a
+        # separate bounds check
+        self.spaces = [None] * OFF_BOARD + [_BORDER]
+        # Zobrist key of the position with blue to move, place_piece and friends keep it current
+        self.zobrist_key = 0
+        # running evaluation (material and square bonuses, see EVAL_TABLES) and official points per color
+        self.scores = {"blue": 0, "red": 0}
+        self.points = {"blue": 0, "red": 0}
+        # undo stack for make/unmake, allocated once and grown only if a line gets longer than it
+        self._undo_moves = [PASS_MOVE] * _UNDO_STACK_SIZE
+        self._undo_captures = [None] * _UNDO_STACK_SIZE
+        # where each captured piece was in its side's piece list, so unmake puts it back in the same place
+        self._undo_indexes = [0] * _UNDO_STACK_SIZE
+        self._ply = 0
+        self.blue_fortress_spaces = FORTRESS_SPACES["blue"]
+        self.red_fortress_spaces = FORTRESS_SPACES["red"]
+        self._fortress_spaces = self.red_fortress_spaces | self.blue_fortress_spaces
+        self.pieces = {"blue": {"general": None, "other-pieces": []}, "red": {"general": None, "other-pieces": []}}
+        for kind, color, space in START_SETUP if setup is None else setup:
+            if kind is General:
+                self.pieces[color]["general"] = General(color, space, self)
+            else:
+                self.pieces[color]["other-pieces"].append(kind(color, space, self))
 
     @property
     def fortress_spaces(self):
         """Returns the fortress spaces
-        Returns: list"""
-        return self.red_fortress_spaces+self.blue_fortress_spaces
+        Returns: frozenset"""
+        return self._fortress_spaces
 
-    def valid_space(self, space: str):
+    def valid_space(self, space: int):
         """Determines if a space is a valid space
         Args:
-            space: str
+            space: int
         Returns: True | False"""
-        if space in self.spaces:
-            return True
-        return False
+        return 0 <= space < OFF_BOARD
 
-    def place_piece(self, piece: Piece, space: str):
+    def place_piece(self, piece: Piece, space: int):
         """Places a piece on the board
         Args:
             piece: JanggiGame.Piece
-            space: str
+            space: int
         Returns: None"""
         if not self.valid_space(space):
             raise SpaceError(f"{space} is not a valid space")
         if self.spaces[space] is not None:
-            raise SpaceError(f"{space} already has a piece")
+            raise SpaceError(f"{space_name(space)} already has a piece")
         self.spaces[space] = piece
-    
-    def assign_space(self, space: str, piece: Piece = None):
+        self.zobrist_key ^= ZOBRIST_KEYS[type(piece), piece.color][space]
+        self._count(piece, space, 1)
+
+    def _count(self, piece: Piece, space: int, sign: int):
+        """Adds (sign 1) or takes away (sign -1) a piece on the space in the running scores and points"""
+        kind = type(piece)
+        self.scores[piece.color] += sign * EVAL_TABLES[kind, piece.color][space]
+        self.points[piece.color] += sign * PIECE_POINTS[kind]
+
+    def assign_space(self, space: int, piece: Piece = None):
         """Assigns a new value to a space. This should be either a Piece or None. Raises SpaceError if the space isn't valid
         Args:
-            space: str
+            space: int
             piece: piece or None
         Returns: None"""
         if self.valid_space(space):
@@ -315,44 +476,150 @@ class Board:
         else:
             raise SpaceError(f"{space} is not a valid space")
 
-    def move_piece(self, piece: Piece, new_space: str):
+    def move_piece(self, piece: Piece, new_space: int):
         """Moves a piece to a new space
         Args:
             piece: JanggiGame.Piece
-            new_space: str
+            new_space: int
         Returns: None"""
+        keys = ZOBRIST_KEYS[type(piece), piece.color]
+        self.zobrist_key ^= keys[piece.space] ^ keys[new_space]
+        table = EVAL_TABLES[type(piece), piece.color]
+        self.scores[piece.color] += table[new_space] - table[piece.space]
         self.assign_space(piece.space, None)
         self.assign_space(new_space, piece)
 
-    def remove_piece(self, space: str):
+    def remove_piece(self, space: int):
         """Removes a piece from the board.
         Args:
-            space: str
+            space: int
         Returns: None"""
         piece = self.get_piece(space)
         self.assign_space(space, None)
         self.pieces[piece.color]["other-pieces"].remove(piece)
+        self.zobrist_key ^= ZOBRIST_KEYS[type(piece), piece.color][space]
+        self._count(piece, space, -1)
 
-    def add_piece(self, space: str, piece: Piece):
+    def add_piece(self, space: int, piece: Piece):
         """Adds a piece back to the board.
         Args:
-            space: str
+            space: int
             piece: janggiGame.Piece
         Returns: None"""
         self.assign_space(space, piece)
         self.pieces[piece.color]["other-pieces"].append(piece)
+        self.zobrist_key ^= ZOBRIST_KEYS[type(piece), piece.color][space]
+        self._count(piece, space, 1)
+
+    def make(self, move: int):
+        """Makes an encoded move (see encode_move) and pushes what unmake needs onto the undo stack. It does no
+        legality checking. A move from a space to itself passes.
+        Args:
+            move: int
+        Returns: None"""
+        curr_space, new_space = divmod(move & MOVE_MASK, OFF_BOARD)
+        ply = self._ply
+        if ply == len(self._undo_moves):
+            self._undo_moves += [PASS_MOVE] * ply
+            self._undo_captures += [None] * ply
+            self._undo_indexes += [0] * ply
+        self._undo_moves[ply] = move
+        self._ply = ply + 1
+        key = self.zobrist_key ^ ZOBRIST_SIDE
+        if curr_space != new_space:
+            spaces = self.spaces
+            piece = spaces[curr_space]
+            captured_piece = spaces[new_space]
+            kind = type(piece)
+            keys = ZOBRIST_KEYS[kind, piece.color]
+            key ^= keys[curr_space] ^ keys[new_space]
+            table = EVAL_TABLES[kind, piece.color]
+            self.scores[piece.color] += table[new_space] - table[curr_space]
+            if captured_piece is not None:
+                captured_kind = type(captured_piece)
+                key ^= ZOBRIST_KEYS[captured_kind, captured_piece.color][new_space]
+                self.scores[captured_piece.color] -= EVAL_TABLES[captured_kind, captured_piece.color][new_space]
+                self.points[captured_piece.color] -= PIECE_POINTS[captured_kind]
+                captured_pieces = self.pieces[captured_piece.color]["other-pieces"]
+                index = captured_pieces.index(captured_piece)
+                del captured_pieces[index]
+                self._undo_captures[ply] = captured_piece
+                self._undo_indexes[ply] = index
+            spaces[curr_space] = None
+            spaces[new_space] = piece
+            piece._space = new_space  # same as Piece.change_space without going through move_piece again
+        self.zobrist_key = key
+
+    def unmake(self):
+        """Takes back the last move made with make
+        Returns: None"""
+        ply = self._ply - 1
+        self._ply = ply
+        curr_space, new_space = divmod(self._undo_moves[ply] & MOVE_MASK, OFF_BOARD)
+        key = self.zobrist_key ^ ZOBRIST_SIDE
+        if curr_space != new_space:
+            spaces = self.spaces
+            piece = spaces[new_space]
+            captured_piece = self._undo_captures[ply]
+            kind = type(piece)
+            keys = ZOBRIST_KEYS[kind, piece.color]
+            key ^= keys[curr_space] ^ keys[new_space]
+            table = EVAL_TABLES[kind, piece.color]
+            self.scores[piece.color] += table[curr_space] - table[new_space]
+            spaces[curr_space] = piece
+            spaces[new_space] = captured_piece
+            piece._space = curr_space
+            if captured_piece is not None:
+                captured_kind = type(captured_piece)
+                key ^= ZOBRIST_KEYS[captured_kind, captured_piece.color][new_space]
+                self.scores[captured_piece.color] += EVAL_TABLES[captured_kind, captured_piece.color][new_space]
+                self.points[captured_piece.color] += PIECE_POINTS[captured_kind]
+                self.pieces[captured_piece.color]["other-pieces"].insert(self._undo_indexes[ply], captured_piece)
+                self._undo_captures[ply] = None
+        self.zobrist_key = key
+
+    def evaluate(self, color: str):
+        """Returns the static evaluation from color's side: its material and square bonuses minus its opponent's
+        (see EVAL_TABLES), in hundredths of a point. The totals are kept up to date by every move, so this is a
+        lookup.
+        Args:
+            color: str
+        Returns: int"""
+        scores = self.scores
+        return scores[color] - scores[OPPONENT[color]]
+
+    def point_count(self, color: str):
+        """Returns color's official point count: the points of its pieces on the board (PIECE_POINTS), plus
+        RED_KOMI for red
+        Args:
+            color: str
+        Returns: float"""
+        return self.points[color] + (RED_KOMI if color == "red" else 0)
+
+    def last_move(self):
+        """Returns the last move made with make (and not taken back), or None
+        Returns: int | None"""
+        if self._ply == 0:
+            return None
+        return self._undo_moves[self._ply - 1]
+
+    def toggle_side(self):
+        """Flips the side to move in the Zobrist key without touching the undo stack. Board.make/unmake do this
+        themselves.
+        Returns: None"""
+        self.zobrist_key ^= ZOBRIST_SIDE
 
     def get_fortress_spaces(self, color: str):
         """Gets the fortress spaces for a color
         Args:
             color: str
-        Returns: list"""
+        Returns: frozenset"""
         if color == "red":
             return self.red_fortress_spaces
         elif color == "blue":
             return self.blue_fortress_spaces
         else:
-            return []
+            return frozenset()
 
     def get_general(self, color: str):
         """Gets the color's general.
@@ -373,47 +640,36 @@ class Board:
 
     def get_row_spaces(self, row: int):
         """gets a row's spaces"""
-        return [space for space in self.spaces if Space(space).row == row]
+        return list(range((row - 1) * COLS, row * COLS))
 
     def get_row(self, row: int):
         """gets a row's values"""
-        return [self.spaces[space] for space in self.get_row_spaces(row)]
+        return self.spaces[(row - 1) * COLS:row * COLS]
 
-    def get_piece(self, space: str):
+    def get_piece(self, space: int):
         """gets a piece"""
         if not self.valid_space(space):
             raise SpaceError(f"{space} is not a valid space")
         return self.spaces[space]
 
-    def has_piece(self, space: str):
+    def has_piece(self, space: int):
         """Returns True if the space has a piece. It will return False otherwise (even if the space is invalid)."""
-        if not self.valid_space(space):
-            return False
-        if self.spaces[space] is None:
-            return False
-        return True
+        piece = self.spaces[space]
+        return piece is not None and piece is not _BORDER
 
-    def space_open(self, space: str):
-        """Returns True if the space is open"""
-        if not self.valid_space(space):
-            return False
-        return not self.has_piece(space)
-        
-    def has_player_piece(self, space, color):
+    def space_open(self, space: int):
+        """Returns True if the space is open. The OFF_BOARD sentinel is never open."""
+        return self.spaces[space] is None
+
+    def has_player_piece(self, space: int, color: str):
         """Returns true if the space has a player's piece."""
-        if self.has_piece(space):
-            piece = self.spaces[space]
-            if piece.color == color:
-                return True
-        return False
+        piece = self.spaces[space]
+        return piece is not None and piece is not _BORDER and piece.color == color
 
-    def has_opponent_piece(self, space: str, color: str):
+    def has_opponent_piece(self, space: int, color: str):
         """Returns true if the space has an opponents piece"""
-        if self.has_piece(space):
-            piece = self.spaces[space]
-            if piece.color != color:
-                return True
-        return False
+        piece = self.spaces[space]
+        return piece is not None and piece is not _BORDER and piece.color != color
 
     def get_pieces(self, color: str):
         """Gets all the player's current playable (not captured) pieces."""
@@ -424,107 +680,353 @@ class Board:
         as well as spaces with another piece of the same color. This allows checking for checkmate. If a general tries to capture a piece that is also one of
         another pieces attacking spaces, it can't move there since it would be captured on the next move.
 
-        Returns: list"""
+        Returns: set"""
         if color == "blue":
             pieces = self.get_pieces("red")
         else:
             pieces = self.get_pieces("blue")
         all_spaces = set()
         for piece in pieces:
-            spaces = piece.get_attacking_spaces()
-            for space in spaces:
-                all_spaces.add(space)
+            all_spaces.update(piece.get_attacking_spaces())
         return all_spaces
 
-    def get_right_space(self, space: str):
+    def attackers_of(self, space: int, color: str):
+        """Returns the spaces of color's pieces that attack the space, found by looking outward from the space
+        instead of generating every piece's attacks: rays for chariots and cannons (counting the screen), horse and
+        elephant paths in reverse, soldiers and guards. Like Piece.get_attacking_spaces a piece attacks a space held
+        by its own side too, except for guards.
+        Args:
+            space: int
+            color: str
+        Returns: list"""
+        spaces = self.spaces
+        attackers = []
+        for ray in ORTHOGONAL_RAYS[space] + PALACE_RAYS[space]:
+            screen_found = False
+            for ray_space in ray:
+                piece = spaces[ray_space]
+                if piece is None:
+                    continue
+                kind = type(piece)
+                if screen_found:
+                    if kind is Cannon and piece.color == color:
+                        attackers.append(ray_space)
+                    break
+                if kind is Cannon:  # a cannon can't be a screen
+                    break
+                if kind is Chariot and piece.color == color:
+                    attackers.append(ray_space)
+                screen_found = True
+        for leg, origin in HORSE_ATTACKERS[space]:
+            piece = spaces[origin]
+            if piece is not None and type(piece) is Horse and piece.color == color and spaces[leg] is None:
+                attackers.append(origin)
+        for first_leg, second_leg, origin in ELEPHANT_ATTACKERS[space]:
+            piece = spaces[origin]
+            if (piece is not None and type(piece) is Elephant and piece.color == color
+                    and spaces[first_leg] is None and spaces[second_leg] is None):
+                attackers.append(origin)
+        for origin in SOLDIER_ATTACKERS[color][space]:
+            piece = spaces[origin]
+            if piece is not None and type(piece) is Soldier and piece.color == color:
+                attackers.append(origin)
+        if not self.has_player_piece(space, color):
+            for origin in FORTRESS_STEPS[space]:
+                piece = spaces[origin]
+                if piece is not None and type(piece) is Guard and piece.color == color:
+                    attackers.append(origin)
+        return attackers
+
+    def get_discovery_spaces(self, color: str):
+        """Returns the spaces where a change of occupancy could expose color's general to an attack it isn't under
+        now: every space along the general's rays up to the third piece (a cannon needs a screen, so the third piece
+        counts), and the legs of enemy horses and elephants aimed at the general. A move that neither leaves nor
+        lands on one of them (and isn't a general move) can't put the general in check.
+        Args:
+            color: str
+        Returns: set"""
+        spaces = self.spaces
+        opponent = OPPONENT[color]
+        general_space = self.get_general(color).space
+        discovery_spaces = set()
+        for ray in ORTHOGONAL_RAYS[general_space] + PALACE_RAYS[general_space]:
+            pieces_seen = 0
+            for space in ray:
+                discovery_spaces.add(space)
+                if spaces[space] is not None:
+                    pieces_seen += 1
+                    if pieces_seen == 3:
+                        break
+        for leg, origin in HORSE_ATTACKERS[general_space]:
+            piece = spaces[origin]
+            if piece is not None and type(piece) is Horse and piece.color == opponent:
+                discovery_spaces.add(leg)
+        for first_leg, second_leg, origin in ELEPHANT_ATTACKERS[general_space]:
+            piece = spaces[origin]
+            if piece is not None and type(piece) is Elephant and piece.color == opponent:
+                discovery_spaces.add(first_leg)
+                discovery_spaces.add(second_leg)
+        return discovery_spaces
+
+    def exposes_general(self, move: int, color: str):
+        """Returns True if making the move would leave color's general attacked. The move is made and taken straight
+        back.
+        Args:
+            move: int
+            color: str
+        Returns: True | False"""
+        self.make(move)
+        exposed = self.is_attacked(self.get_general(color).space, OPPONENT[color])
+        self.unmake()
+        return exposed
+
+    def generate_evasions(self, color: str):
+        """Yields color's legal moves out of check as (curr_space, new_space) pairs, general steps first. Besides
+        general steps the only candidates are captures of a checking piece, moves onto the spaces between a chariot
+        or cannon and the general or onto a horse or elephant leg, and moves of a cannon's screen. Each candidate is
+        tried on the board, so with more than one checker only moves that deal with all of them come out. Yields
+        nothing when color isn't in check.
+        Args:
+            color: str
+        Returns: generator"""
+        spaces = self.spaces
+        general = self.get_general(color)
+        general_space = general.space
+        checkers = self.attackers_of(general_space, OPPONENT[color])
+        if not checkers:
+            return
+        block_spaces = set(checkers)
+        screen_spaces = set()
+        for checker in checkers:
+            kind = type(spaces[checker])
+            if kind is Chariot or kind is Cannon:
+                for ray in ORTHOGONAL_RAYS[general_space] + PALACE_RAYS[general_space]:
+                    if checker in ray:
+                        between = ray[:ray.index(checker)]
+                        block_spaces.update(between)
+                        if kind is Cannon:
+                            screen_spaces.update(space for space in between if spaces[space] is not None)
+                        break
+            elif kind is Horse:
+                block_spaces.update(leg for leg, origin in HORSE_ATTACKERS[general_space] if origin == checker)
+            elif kind is Elephant:
+                for first_leg, second_leg, origin in ELEPHANT_ATTACKERS[general_space]:
+                    if origin == checker:
+                        block_spaces.update((first_leg, second_leg))
+        for new_space in general.get_fortress_moves():
+            if not self.exposes_general(encode_move(general_space, new_space), color):
+                yield general_space, new_space
+        for piece in list(self.get_pieces(color)):
+            curr_space = piece.space
+            is_screen = curr_space in screen_spaces
+            for new_space in piece.get_legal_moves():
+                if ((is_screen or new_space in block_spaces)
+                        and not self.exposes_general(encode_move(curr_space, new_space), color)):
+                    yield curr_space, new_space
+
+    def generate_legal_moves(self, color: str, captures_only: bool = False):
+        """Yields color's legal moves as (curr_space, new_space) pairs, ending with the pass (the general's space
+        twice) unless color is in check. Moves are only tried on the board when they could matter to the general's
+        safety: moves touching a discovery space (see get_discovery_spaces); the general's own moves are already
+        checked by General.get_legal_moves. In check only the evasions are generated (see generate_evasions). With
+        captures_only just the captures come out. The caller may make moves between yields as long as it takes them
+        back.
+        Args:
+            color: str
+            captures_only: bool
+        Returns: generator"""
+        spaces = self.spaces
+        general = self.get_general(color)
+        general_space = general.space
+        if self.is_attacked(general_space, OPPONENT[color]):
+            for curr_space, new_space in self.generate_evasions(color):
+                if not captures_only or spaces[new_space] is not None:
+                    yield curr_space, new_space
+            return
+        discovery_spaces = self.get_discovery_spaces(color)
+        for piece in self.get_pieces(color) + [general]:
+            curr_space = piece.space
+            for new_space in piece.get_legal_moves():
+                if captures_only and spaces[new_space] is None:
+                    continue
+                if (piece is general
+                        or curr_space not in discovery_spaces and new_space not in discovery_spaces):
+                    yield curr_space, new_space
+                elif not self.exposes_general(encode_move(curr_space, new_space), color):
+                    yield curr_space, new_space
+        if not captures_only:
+            yield general_space, general_space
+
+    def generate_reference_moves(self, color: str):
+        """Yields color's legal moves the slow and simple way, for checking generate_legal_moves: every move each
+        piece's get_legal_moves gives, tried on the board with exposes_general, and the pass unless color is in
+        check. Same order as generate_legal_moves when color isn't in check.
+        Args:
+            color: str
+        Returns: generator"""
+        general = self.get_general(color)
+        for piece in self.get_pieces(color) + [general]:
+            curr_space = piece.space
+            for new_space in piece.get_legal_moves():
+                if not self.exposes_general(encode_move(curr_space, new_space), color):
+                    yield curr_space, new_space
+        if not self.is_attacked(general.space, OPPONENT[color]):
+            yield general.space, general.space
+
+    def static_exchange(self, move: int):
+        """Returns what a capture wins in material once both sides have recaptured on its space for as long as it
+        pays them, each using its least valuable attacker (see least_valuable_attacker). The exchange is played out
+        on the board with make/unmake, so screens cannons gain or lose as pieces come off are taken into account.
+        Pins are not. Scores are in PIECE_VALUES units.
+        Args:
+            move: int
+        Returns: int"""
+        curr_space, space = divmod(move & MOVE_MASK, OFF_BOARD)
+        spaces = self.spaces
+        gains = [PIECE_VALUES[type(spaces[space])]]
+        on_space = PIECE_VALUES[type(spaces[curr_space])]
+        color = OPPONENT[spaces[curr_space].color]
+        self.make(move)
+        made = 1
+        while True:
+            attacker = self.least_valuable_attacker(space, color)
+            if attacker is None:
+                break
+            gains.append(on_space - gains[-1])
+            on_space = PIECE_VALUES[type(spaces[attacker])]
+            self.make(encode_move(attacker, space))
+            made += 1
+            color = OPPONENT[color]
+        for _ in range(made):
+            self.unmake()
+        # either side can stop recapturing when going on loses it material
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = min(gains[-1], -gain)
+        return gains[0]
+
+    def least_valuable_attacker(self, space: int, color: str):
+        """Returns the space of color's cheapest piece that can capture on the space (held by the other side), or
+        None. A cannon can't capture a cannon. The general comes last, and only when the capture leaves it safe.
+        Args:
+            space: int
+            color: str
+        Returns: int | None"""
+        spaces = self.spaces
+        target_is_cannon = type(spaces[space]) is Cannon
+        least = None
+        least_value = None
+        for attacker in self.attackers_of(space, color):
+            kind = type(spaces[attacker])
+            if kind is Cannon and target_is_cannon:
+                continue
+            if least is None or PIECE_VALUES[kind] < least_value:
+                least = attacker
+                least_value = PIECE_VALUES[kind]
+        if least is not None:
+            return least
+        general_space = self.get_general(color).space
+        if space in FORTRESS_STEPS[general_space]:
+            self.make(encode_move(general_space, space))
+            safe = not self.attackers_of(space, OPPONENT[color])
+            self.unmake()
+            if safe:
+                return general_space
+        return None
+
+    def perft(self, color: str, depth: int, bulk: bool = True, table: dict = None, reference: bool = False):
+        """Counts the leaves of the legal move tree depth plies deep with color to move. With bulk the last ply is
+        counted straight off the move generator instead of making each move. With a table (a dict) subtree counts
+        are stored by Zobrist key and depth and reused when a position comes up again. With reference the moves come
+        from generate_reference_moves instead of generate_legal_moves.
+        Args:
+            color: str
+            depth: int
+            bulk: bool
+            table: dict | None
+            reference: bool
+        Returns: int"""
+        if depth == 0:
+            return 1
+        generate = self.generate_reference_moves if reference else self.generate_legal_moves
+        if depth == 1 and bulk:
+            return sum(1 for _ in generate(color))
+        if table is not None:
+            entry = (self.zobrist_key, depth)
+            count = table.get(entry)
+            if count is not None:
+                return count
+        opponent = OPPONENT[color]
+        count = 0
+        for curr_space, new_space in generate(color):
+            self.make(encode_move(curr_space, new_space))
+            count += self.perft(opponent, depth - 1, bulk, table, reference)
+            self.unmake()
+        if table is not None:
+            table[entry] = count
+        return count
+
+    def is_attacked(self, space: int, color: str):
+        """Returns True if any of color's pieces attack the space, the question every check test asks (see
+        attackers_of).
+        Args:
+            space: int
+            color: str
+        Returns: True | False"""
+        return bool(self.attackers_of(space, color))
+
+    def get_right_space(self, space: int):
         """gets space to the right"""
-        space = Space(space)
-        col = chr(space.col + 1)
-        row = str(space.row)
-        right_space = col + row
-        return right_space
+        return NEIGHBORS[space][RIGHT]
 
-    def get_left_space(self, space: str):
+    def get_left_space(self, space: int):
         """Gets space to the left"""
-        space = Space(space)
-        col = chr(space.col - 1)
-        row = str(space.row)
-        left_space = col + row
-        return left_space
+        return NEIGHBORS[space][LEFT]
 
-    def get_top_space(self, space: str):
+    def get_top_space(self, space: int):
         """gets space above"""
-        space = Space(space)
-        col = chr(space.col)
-        row = str(space.row - 1)
-        top_space = col + row
-        return top_space
+        return NEIGHBORS[space][TOP]
 
-    def get_bottom_space(self, space: str):
+    def get_bottom_space(self, space: int):
         """gets space below"""
-        space = Space(space)
-        col = chr(space.col)
-        row = str(space.row + 1)
-        bottom_space = col + row
-        return bottom_space
+        return NEIGHBORS[space][BOTTOM]
 
-    def get_top_right_space(self, space: str):
+    def get_top_right_space(self, space: int):
         """Gets top right space"""
-        space = Space(space)
-        col = chr(space.col + 1)
-        row = str(space.row - 1)
-        top_right_space = col + row
-        return top_right_space
+        return NEIGHBORS[space][TOP_RIGHT]
 
-    def get_top_left_space(self, space: str):
+    def get_top_left_space(self, space: int):
         """gets top left space (pointless docstring ik)"""
-        space = Space(space)
-        col = chr(space.col - 1)
-        row = str(space.row - 1)
-        top_left_space = col + row
-        return top_left_space
+        return NEIGHBORS[space][TOP_LEFT]
 
-    def get_bottom_right_space(self, space: str):
+    def get_bottom_right_space(self, space: int):
         """gets bottom right space"""
-        space = Space(space)
-        col = chr(space.col + 1)
-        row = str(space.row + 1)
-        bottom_right_space = col + row
-        return bottom_right_space
+        return NEIGHBORS[space][BOTTOM_RIGHT]
 
-    def get_bottom_left_space(self, space: str):
+    def get_bottom_left_space(self, space: int):
         """gets bottom left space"""
-        space = Space(space)
-        col = chr(space.col - 1)
-        row = str(space.row + 1)
-        bottom_left_space = col + row
-        return bottom_left_space
+        return NEIGHBORS[space][BOTTOM_LEFT]
 
 
 class FortressPiece(Piece):
     """Base class for General and Guard"""
 
-    def get_available_adjacent_spaces(self, starting_space:str=None):
+    def get_available_adjacent_spaces(self, starting_space: int = None):
         """gets the available adjacent spaces in the fortress.
         Args:
-            starting_space: str
+            starting_space: int
         Returns: list"""
-        curr_space = starting_space or self.space
+        curr_space = self.space if starting_space is None else starting_space
         board = self._board
-        adjacent_spaces = [board.get_top_space(curr_space), board.get_bottom_space(curr_space), board.get_left_space(curr_space),
-                           board.get_right_space(curr_space), board.get_bottom_left_space(curr_space), board.get_bottom_right_space(curr_space),
-                           board.get_top_left_space(curr_space), board.get_top_right_space(curr_space)]
         return [
-            space for space in adjacent_spaces
-            if (board.has_opponent_piece(space, self.color) or board.space_open(space)) and board.valid_space(space)
+            space for space in FORTRESS_STEPS[curr_space]
+            if board.space_open(space) or board.has_opponent_piece(space, self.color)
         ]
 
     def get_fortress_moves(self):
         """Returns the available spaces in the fortress the piece can move to.
         Returns: list"""
-        adjacent_spaces = set(self.get_available_adjacent_spaces())
-        fortress_spaces = set(self._board.get_fortress_spaces(self.color))
-        return list(fortress_spaces & adjacent_spaces)
+        return self.get_available_adjacent_spaces()
 
 
 class General(FortressPiece):
@@ -533,27 +1035,25 @@ class General(FortressPiece):
     def in_check(self):
         """Returns if the general is in check
         Returns: True | False"""
-        opponent_attacking_spaces = self._board.get_opponents_attacking_spaces(self.color)
-        if self.space in opponent_attacking_spaces:
-            return True
-        return False
+        return self._board.is_attacked(self._space, OPPONENT[self._color])
 
     def in_checkmate(self):
-        """Returns True is the general is in checkmate
+        """Returns True is the general is in checkmate: it's in check and no move (of the general or of another piece
+        capturing the checker or blocking it) gets it out. Stops at the first way out.
         Returns: True | False"""
-        if self.in_check():
-            legal_moves = self.get_legal_moves()
-            if legal_moves:
-                return False
-            return True
-        else:
+        for _ in self._board.generate_evasions(self._color):
             return False
+        return self.in_check()
 
     def get_legal_moves(self):
-        """Returns a list of spaces the general can move to
+        """Returns a list of spaces the general can move to. Each step is tried on the board, since stepping off a
+        cannon's screen can make a space safe that is attacked while the general stands where it is.
         Returns: list"""
-        opponent_attacking_spaces = self._board.get_opponents_attacking_spaces(self.color)
-        return list(set(self.get_fortress_moves()) - set(opponent_attacking_spaces))
+        board = self._board
+        space = self._space
+        color = self._color
+        return [new_space for new_space in self.get_fortress_moves()
+                if not board.exposes_general(encode_move(space, new_space), color)]
 
 
 class Guard(FortressPiece):
@@ -572,274 +1072,1042 @@ class Guard(FortressPiece):
 class Horse(Piece):
 
     def get_move_sequences(self):
-        """Returns a list of tuples for each possible sequence of moves
-        Returns: list"""
-        forward_space = self.get_forward_space()
-        backward_space = self.get_backward_space()
-        left_space = self.get_left_space()
-        right_space = self.get_right_space()
-        move_sequences = [
-            (forward_space, self.get_diagonal_forward_right(forward_space)),
-            (forward_space, self.get_diagonal_forward_left(forward_space)),
-            (backward_space, self.get_diagonal_backward_left(backward_space)),
-            (backward_space, self.get_diagonal_backward_right(backward_space)),
-            (left_space, self.get_diagonal_forward_left(left_space)),
-            (left_space, self.get_diagonal_backward_left(left_space)),
-            (right_space, self.get_diagonal_forward_right(right_space)),
-            (right_space, self.get_diagonal_backward_right(right_space))
-        ]
-        return move_sequences
+        """Returns a tuple of (leg, destination) tuples for each possible move
+        Returns: tuple"""
+        return HORSE_PATHS[self._space]
 
     def get_attacking_spaces(self):
         """Returns the spaces the piece can attack (this includes spaces that have pieces of the sme color).
         Returns: list"""
-        attacking_spaces = []
-        move_sequences = self.get_move_sequences()
-        board = self._board
-        for spaces in move_sequences:
-            if board.valid_space(spaces[0]) and board.valid_space(spaces[1]):
-                if board.space_open(spaces[0]):
-                    attacking_spaces.append(spaces[1])
-        return attacking_spaces
+        spaces = self._board.spaces
+        return [destination for leg, destination in HORSE_PATHS[self._space] if spaces[leg] is None]
 
     def get_legal_moves(self):
         """Returns list of legal moves
         Returns: list"""
-        legal_moves = []
-        move_sequences = self.get_move_sequences()
         board = self._board
-        for spaces in move_sequences:
-            if board.valid_space(spaces[0]) and board.valid_space(spaces[1]):
-                if board.space_open(spaces[0]) and not board.has_player_piece(spaces[1], self.color):
-                    legal_moves.append(spaces[1])
-        return legal_moves
+        spaces = board.spaces
+        return [
+            destination for leg, destination in HORSE_PATHS[self._space]
+            if spaces[leg] is None and not board.has_player_piece(destination, self.color)
+        ]
         
 
 class Elephant(Piece):
 
     def get_move_sequences(self):
-        """Returns a list of tuples for each possible sequence of moves
-        Returns: list"""
-        forward_space = self.get_forward_space()
-        forward_diag_right_space = self.get_diagonal_forward_right(forward_space)
-        forward_diag_left_space = self.get_diagonal_forward_left(forward_space)
-        backward_space = self.get_backward_space()
-        backward_diag_right_space = self.get_diagonal_backward_right(backward_space)
-        backward_diag_left_space = self.get_diagonal_backward_left(backward_space)
-        left_space = self.get_left_space()
-        left_diag_forward_space = self.get_diagonal_forward_left(left_space)
-        left_diag_backward_space = self.get_diagonal_backward_left(left_space)
-        right_space = self.get_right_space()
-        right_diag_forward_space = self.get_diagonal_forward_right(right_space)
-        right_diag_backward_space = self.get_diagonal_backward_right(right_space)
-        move_sequences = [
-            (forward_space, forward_diag_right_space, self.get_diagonal_forward_right(forward_diag_right_space)),
-            (forward_space, forward_diag_left_space , self.get_diagonal_forward_left(forward_diag_left_space)),
-            (backward_space, backward_diag_right_space, self.get_diagonal_backward_right(backward_diag_right_space)),
-            (backward_space, backward_diag_left_space, self.get_diagonal_backward_left(backward_diag_left_space)),
-            (right_space, right_diag_forward_space, self.get_diagonal_forward_right(right_diag_forward_space)),
-            (right_space, right_diag_backward_space, self.get_diagonal_backward_right(right_diag_backward_space)),
-            (left_space, left_diag_forward_space, self.get_diagonal_forward_left(left_diag_forward_space)),
-            (left_space, left_diag_backward_space, self.get_diagonal_backward_left(left_diag_backward_space))
-        ]
-        return move_sequences
+        """Returns a tuple of (leg, leg, destination) tuples for each possible move
+        Returns: tuple"""
+        return ELEPHANT_PATHS[self._space]
 
     def get_attacking_spaces(self):
         """Returns the spaces the piece can attack (this includes spaces that have pieces of the sme color).
         Returns: list"""
-        attacking_spaces = []
-        move_sequences = self.get_move_sequences()
-        board = self._board
-        for spaces in move_sequences:
-            if board.valid_space(spaces[0]) and board.valid_space(spaces[1]) and board.valid_space(spaces[2]):
-                if board.space_open(spaces[0]) and board.space_open(spaces[1]):
-                    attacking_spaces.append(spaces[2])
-        return attacking_spaces
-
+        spaces = self._board.spaces
+        return [
+            destination for first_leg, second_leg, destination in ELEPHANT_PATHS[self._space]
+            if spaces[first_leg] is None and spaces[second_leg] is None
+        ]
 
     def get_legal_moves(self):
         """gets the legal move
         Returns: list"""
-        legal_moves = []
-        move_sequences = self.get_move_sequences()
         board = self._board
-        for spaces in move_sequences:
-            if board.valid_space(spaces[0]) and board.valid_space(spaces[1]) and board.valid_space(spaces[2]):
-                if board.space_open(spaces[0]) and board.space_open(spaces[1]) and not board.has_player_piece(spaces[2], self.color):
-                    legal_moves.append(spaces[2])
-        return legal_moves
+        spaces = board.spaces
+        return [
+            destination for first_leg, second_leg, destination in ELEPHANT_PATHS[self._space]
+            if spaces[first_leg] is None and spaces[second_leg] is None and not board.has_player_piece(destination, self.color)
+        ]
 
 
 class Chariot(Piece):
 
-    _diagonal_moves = {"d3": ["e2", "f1"], "d1": ["e2", "f3"], "f1": ["e2", "d3"], "f3": ["e2", "d1"],
-                       "e2": ["d1", "f1", "d3", "f3"],
-                       "d8": ["e9", "f10"], "d10": ["e9", "f8"], "f8": ["e9", "d10"], "f10": ["e9", "d8"],
-                       "e9": ["d8", "f8", "d10", "f10"]}
+    def get_rays(self):
+        """Returns the rays the piece slides along: the four orthogonal rays and, in a fortress, the diagonals.
+        Returns: tuple"""
+        return ORTHOGONAL_RAYS[self._space] + PALACE_RAYS[self._space]
 
-    def get_moves_in_direction(self, next_space_method, move_type: str = "legal"):
+    def get_moves_in_direction(self, ray: tuple, move_type: str = "legal"):
         """gets spaces the piece can move to in a given direction.
 
         Args:
-            next_space_method: a method for getting the next space
+            ray: tuple
+                spaces in the direction, nearest first (see ORTHOGONAL_RAYS and PALACE_RAYS)
             move_type: 'attacking' | 'legal'
         Returns: list"""
-        
-        get_next_space = next_space_method
         spaces = []
         board = self._board
-        space = get_next_space()
-        while board.valid_space(space) and board.space_open(space):
-            spaces.append(space)
-            space = get_next_space(space)
-        if board.has_opponent_piece(space, self.color) and move_type == "legal" and board.valid_space(space):
-            spaces.append(space)
-        elif move_type == "attacking" and board.valid_space(space):
-            spaces.append(space)
-        else:
-            pass
+        for space in ray:
+            if board.space_open(space):
+                spaces.append(space)
+                continue
+            if move_type == "attacking" or board.has_opponent_piece(space, self.color):
+                spaces.append(space)
+            break
         return spaces
     
     def get_legal_moves(self):
         """gets the legal move
         Returns: list"""
-        legal_forward_spaces = self.get_moves_in_direction(self.get_forward_space)
-        legal_left_spaces = self.get_moves_in_direction(self.get_left_space)
-        legal_right_spaces = self.get_moves_in_direction(self.get_right_space)
-        legal_backward_spaces = self.get_moves_in_direction(self.get_backward_space)
-        spaces = legal_forward_spaces+legal_left_spaces+legal_right_spaces+legal_backward_spaces
-        if self.in_fortress():
-            board = self._board
-            diag_spaces = self._diagonal_moves[self.space]
-            if self.space in ["e2", "e9"]:
-                for space in diag_spaces:
-                    if board.has_opponent_piece(space, self.color) or board.space_open(space):
-                        spaces.append(space)
-            else:
-                seq = SpaceSequence(diag_spaces)
-                diag_legal_moves = self.get_moves_in_direction(seq.get_next)
-                spaces += diag_legal_moves
+        spaces = []
+        for ray in self.get_rays():
+            spaces += self.get_moves_in_direction(ray)
         return spaces
 
     def get_attacking_spaces(self):
         """Returns the spaces the piece can attack (this includes spaces that have pieces of the sme color).
         Returns: list"""
-        attacking_forward_spaces = self.get_moves_in_direction(self.get_forward_space, "attacking")
-        attacking_left_spaces = self.get_moves_in_direction(self.get_left_space, "attacking")
-        attacking_right_spaces = self.get_moves_in_direction(self.get_right_space, "attacking")
-        attacking_backward_spaces = self.get_moves_in_direction(self.get_backward_space, "attacking")
-        spaces = attacking_forward_spaces+attacking_left_spaces+attacking_right_spaces+attacking_backward_spaces
-        if self.in_fortress() and self.space in self._diagonal_moves:
-            diag_spaces = self._diagonal_moves[self.space]
-            if self.space in ["e2", "e9"]:
-                for space in diag_spaces:
-                    spaces.append(space)
-            else:
-                seq = SpaceSequence(diag_spaces)
-                diag_legal_moves = self.get_moves_in_direction(seq.get_next, "attacking")
-                spaces += diag_legal_moves
+        spaces = []
+        for ray in self.get_rays():
+            spaces += self.get_moves_in_direction(ray, "attacking")
         return spaces
 
         
 class Cannon(Piece):
 
-    _diagonal_moves = {"d1": ["e2", "f3"], "f1": ["e2", "d3"], "d3": ["e2", "f1"], "f3": ["e2", "d1"],
-                       "d8": ["e9", "f10"], "f8": ["e9", "d10"], "d10": ["e9", "f8"], "f10": ["e9", "d8"]}
+    def get_rays(self):
+        """Returns the rays the piece jumps along: the four orthogonal rays and, from a fortress corner, the diagonal.
+        Returns: tuple"""
+        return ORTHOGONAL_RAYS[self._space] + PALACE_RAYS[self._space]
 
-    def get_moves_in_direction(self, next_space_method, move_type: str = "legal"):
+    def get_moves_in_direction(self, ray: tuple, move_type: str = "legal"):
         """gets spaces the piece can move to in a given direction.
         Args:
-            next_space_method: a method for getting the next space
+            ray: tuple
+                spaces in the direction, nearest first (see ORTHOGONAL_RAYS and PALACE_RAYS)
             move_type: 'attacking' | 'legal'
         Returns: list"""
-        get_next_space = next_space_method
         spaces = []
         board = self._board
-        space = get_next_space()
-        while board.space_open(space) and board.valid_space(space):
-            space = get_next_space(space)
-        if board.has_piece(space) and board.valid_space(space):
+        screen_found = False
+        for space in ray:
+            if board.space_open(space):
+                if screen_found:
+                    spaces.append(space)
+                continue
             piece = board.get_piece(space)
-            if type(piece) == Cannon: # Cannon can't jump over another Cannon
-                return []
-            space = get_next_space(space)
-        while board.valid_space(space) and board.space_open(space):
-            spaces.append(space)
-            space = get_next_space(space)
-        if move_type == "legal" and board.has_opponent_piece(space, self.color) and board.valid_space(space) and type(board.get_piece(space)) != Cannon:
-            spaces.append(space)
-        if move_type == "attacking" and board.valid_space(space):
-            spaces.append(space)
+            if not screen_found:
+                if type(piece) == Cannon: # Cannon can't jump over another Cannon
+                    return []
+                screen_found = True
+                continue
+            if move_type == "attacking" or (piece.color != self.color and type(piece) != Cannon):
+                spaces.append(space)
+            break
         return spaces
     
     def get_legal_moves(self):
         """gets the legal move
         Returns: list"""
-        legal_forward_spaces = self.get_moves_in_direction(self.get_forward_space)
-        legal_left_spaces = self.get_moves_in_direction(self.get_left_space)
-        legal_right_spaces = self.get_moves_in_direction(self.get_right_space)
-        legal_backward_spaces = self.get_moves_in_direction(self.get_backward_space) 
-        legal_spaces = legal_forward_spaces+legal_left_spaces+legal_right_spaces+legal_backward_spaces
-        if self.in_fortress() and self.space in self._diagonal_moves:
-            diag_spaces = self._diagonal_moves[self.space]
-            if self._board.has_piece(diag_spaces[0]) and (self._board.has_opponent_piece(self.color, diag_spaces[1]) or self._board.space_open(diag_spaces[1])):
-                legal_spaces.append(diag_spaces[1])
+        legal_spaces = []
+        for ray in self.get_rays():
+            legal_spaces += self.get_moves_in_direction(ray)
         return legal_spaces
 
     def get_attacking_spaces(self):
         """Returns the spaces the piece can attack (this includes spaces that have pieces of the sme color).
         Returns: list"""
-        attacking_forward_spaces = self.get_moves_in_direction(self.get_forward_space, "attacking")
-        attacking_left_spaces = self.get_moves_in_direction(self.get_left_space, "attacking")
-        attacking_right_spaces = self.get_moves_in_direction(self.get_right_space, "attacking")
-        attacking_backward_spaces = self.get_moves_in_direction(self.get_backward_space, "attacking")
-        attacking_spaces = attacking_forward_spaces+attacking_left_spaces+attacking_right_spaces+attacking_backward_spaces
-        if self.in_fortress() and self.space in self._diagonal_moves:
-            diag_spaces = self._diagonal_moves[self.space]
-            if self._board.has_piece(diag_spaces[0]):
-                attacking_spaces.append(diag_spaces[1])
+        attacking_spaces = []
+        for ray in self.get_rays():
+            attacking_spaces += self.get_moves_in_direction(ray, "attacking")
         return attacking_spaces
 
 class Soldier(Piece):
 
-    _diagonal_moves = {"d3": "e2", "f3": "e2", "e2": ["f1", "d1"], "d8": "e9", "f8": "e9", "e9": ["d10", "f10"]}
-    
     def get_legal_moves(self):
         """gets the legal move
         Returns: list"""
-        legal_spaces = []
         board = self._board
-        for space in [self.get_forward_space(), self.get_left_space(), self.get_right_space()]:
-            if (board.has_opponent_piece(space, self.color) or board.space_open(space)) and board.valid_space(space):
-                legal_spaces.append(space)
-        if self.in_fortress() and self.space in self._diagonal_moves:
-            if self.space in ["e2", "e9"]:
-                diag_spaces = self._diagonal_moves[self.space]
-                for space in diag_spaces:
-                    if board.has_opponent_piece(space, self.color) or self._board.space_open(space):
-                        legal_spaces.append(space)
-            else:
-                space = self._diagonal_moves[self.space]
-                if board.has_opponent_piece(space, self.color) or self._board.space_open(space):
-                    legal_spaces.append(space)
-        return legal_spaces
+        return [
+            space for space in SOLDIER_STEPS[self._color][self._space]
+            if board.space_open(space) or board.has_opponent_piece(space, self.color)
+        ]
     
     def get_attacking_spaces(self):
         """Returns the spaces the piece can attack (this includes spaces that have pieces of the sme color).
         Returns: list"""
-        attacking_spaces = []
+        return list(SOLDIER_STEPS[self._color][self._space])
+
+# The usual setup, elephants inside the horses on both sides, in the order Board keeps the pieces
+START_SETUP = tuple((kind, color, space_index(space)) for kind, color, space in (
+    (General, "blue", "e9"), (Chariot, "blue", "a10"), (Chariot, "blue", "i10"), (Elephant, "blue", "b10"),
+    (Elephant, "blue", "g10"), (Horse, "blue", "c10"), (Horse, "blue", "h10"), (Cannon, "blue", "b8"),
+    (Cannon, "blue", "h8"), (Guard, "blue", "d10"), (Guard, "blue", "f10"), (Soldier, "blue", "a7"),
+    (Soldier, "blue", "c7"), (Soldier, "blue", "e7"), (Soldier, "blue", "g7"), (Soldier, "blue", "i7"),
+    (General, "red", "e2"), (Chariot, "red", "a1"), (Chariot, "red", "i1"), (Elephant, "red", "b1"),
+    (Elephant, "red", "g1"), (Horse, "red", "c1"), (Horse, "red", "h1"), (Cannon, "red", "b3"),
+    (Cannon, "red", "h3"), (Guard, "red", "d1"), (Guard, "red", "f1"), (Soldier, "red", "a4"),
+    (Soldier, "red", "c4"), (Soldier, "red", "e4"), (Soldier, "red", "g4"), (Soldier, "red", "i4"),
+))
+
+# FEN as other Janggi engines write it: ranks from row 1 (red's back rank) to row 10, blue (who moves first, "w")
+# in upper case, red in lower case, then the side to move, two unused fields, the plies since the last capture and
+# the move number.
+START_FEN = "rbna1abnr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RBNA1ABNR w - - 0 1"
+FEN_PIECES = {"k": General, "a": Guard, "n": Horse, "b": Elephant, "r": Chariot, "c": Cannon, "p": Soldier}
+_FEN_LETTERS = {(kind, color): letter.upper() if color == "blue" else letter
+                for letter, kind in FEN_PIECES.items() for color in ("blue", "red")}
+_FEN_SQUARES = {(kind.upper() if color == "blue" else kind): (FEN_PIECES[kind], color)
+                for kind in FEN_PIECES for color in ("blue", "red")}
+_FEN_TURNS = {"w": "blue", "b": "red"}
+
+
+def parse_fen(fen: str):
+    """Reads a FEN string into the pieces for Board (a (piece class, color, space) tuple each), the side to move,
+    the plies since the last capture and the move number. Fields after the placement may be left off. Raises
+    FenError if the string is malformed, a side doesn't have exactly one general, or a general or guard is outside
+    its fortress.
+    Args:
+        fen: str
+    Returns: tuple"""
+    fields = fen.split()
+    if not fields or len(fields) > 6:
+        raise FenError(f"{fen!r} is not a FEN string")
+    ranks = fields[0].split("/")
+    if len(ranks) != ROWS:
+        raise FenError(f"{fen!r} doesn't have {ROWS} ranks")
+    setup = []
+    generals = {"blue": 0, "red": 0}
+    squares = _FEN_SQUARES
+    for row, rank in enumerate(ranks):
+        space = row * COLS
+        end = space + COLS
+        for char in rank:
+            if char in squares:
+                if space >= end:
+                    raise FenError(f"rank {rank!r} isn't {COLS} spaces wide")
+                kind, color = squares[char]
+                if kind is General or kind is Guard:
+                    if space not in FORTRESS_SPACES[color]:
+                        raise FenError(f"{SPACE_NAMES[space]} is outside the {color} fortress")
+                    if kind is General:
+                        generals[color] += 1
+                setup.append((kind, color, space))
+                space += 1
+            elif "1" <= char <= "9":
+                space += ord(char) - 48
+            else:
+                raise FenError(f"{char!r} is not a FEN piece")
+        if space != end:
+            raise FenError(f"rank {rank!r} isn't {COLS} spaces wide")
+    if generals["blue"] != 1 or generals["red"] != 1:
+        raise FenError(f"{fields[0]!r} needs one general of each color")
+    turn = _FEN_TURNS.get(fields[1] if len(fields) > 1 else "w")
+    if turn is None:
+        raise FenError(f"{fields[1]!r} is not a side to move")
+    try:
+        halfmove = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise FenError(f"{fen!r} has a move count that isn't a number") from None
+    return tuple(setup), turn, halfmove, fullmove
+
+
+def board_fen(board: 'Board', turn: str = "blue", halfmove: int = 0, fullmove: int = 1):
+    """Writes the position as a FEN string (see parse_fen)
+    Args:
+        board: JanggiGame.Board
+        turn: str
+        halfmove: int
+        fullmove: int
+    Returns: str"""
+    spaces = board.spaces
+    letters = _FEN_LETTERS
+    ranks = []
+    for start in range(0, OFF_BOARD, COLS):
+        rank = ""
+        empty = 0
+        for space in range(start, start + COLS):
+            piece = spaces[space]
+            if piece is None:
+                empty += 1
+            else:
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += letters[type(piece), piece.color]
+        ranks.append(rank + str(empty) if empty else rank)
+    return "%s %s - - %d %d" % ("/".join(ranks), "w" if turn == "blue" else "b", halfmove, fullmove)
+
+
+# Zobrist keys: a random 64-bit number per piece type, color and space (0 for OFF_BOARD) plus one for red to move.
+# The seed is fixed so keys are stable between runs and processes.
+_zobrist_random = random.Random(0x4A414E474749)
+ZOBRIST_KEYS = {
+    (kind, color): tuple(_zobrist_random.getrandbits(64) for _ in range(OFF_BOARD)) + (0,)
+    for kind in (General, Guard, Horse, Elephant, Chariot, Cannon, Soldier) for color in ("blue", "red")
+}
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+
+# Evaluation. PIECE_POINTS is the official point count (red gets RED_KOMI on top for moving second); PIECE_VALUES is
+# the same in hundredths, the unit of the search, and PIECE_SQUARE_TABLES adds a bonus for where a piece stands.
+# Board keeps both totals up to date as pieces move, see Board.evaluate and Board.point_count.
+PIECE_POINTS = {General: 0, Chariot: 13, Cannon: 7, Horse: 5, Elephant: 3, Guard: 3, Soldier: 2}
+PIECE_VALUES = {kind: points * 100 for kind, points in PIECE_POINTS.items()}
+RED_KOMI = 1.5
+
+
+def _square_bonus(kind, advance: int, col: int):
+    """Returns the bonus for a piece of the kind standing advance rows in front of its own back row (0 to 9) on the
+    column (0 to 8). The tables are the same for both colors seen from their own side."""
+    central = 3 <= col <= 5
+    edge = col == 0 or col == 8
+    if kind is Soldier:
+        if advance < 5:
+            return 0
+        if advance == 9:  # can only move sideways there
+            return 10
+        return 20 + 10 * (advance - 5) + (30 if central and advance >= 7 else 10 if central else 0)
+    if kind is Horse:
+        return -20 if edge else 10 if 2 <= col <= 6 and 3 <= advance <= 7 else 0
+    if kind is Elephant:
+        return -10 if edge else 0
+    if kind is Chariot:
+        return (10 if central else 0) + (10 if advance >= 6 else 0)
+    if kind is Cannon:
+        return (10 if col == 4 else 0) + (20 if advance >= 7 and central else 0)
+    if kind is General:
+        return 10 if advance == 1 and col == 4 else 0
+    return 0
+
+
+PIECE_SQUARE_TABLES = {
+    (kind, color): tuple(_square_bonus(kind, space // COLS if color == "red" else ROWS - 1 - space // COLS,
+                                       space % COLS) for space in range(OFF_BOARD)) + (0,)
+    for kind in PIECE_POINTS for color in ("blue", "red")
+}
+# value plus square bonus, what Board.scores adds up
+EVAL_TABLES = {
+    (kind, color): tuple(PIECE_VALUES[kind] + bonus for bonus in table[:OFF_BOARD]) + (0,)
+    for (kind, color), table in PIECE_SQUARE_TABLES.items()
+}
+
+
+# Search. Scores are from the point of view of the side to move, in hundredths of a point (see Board.evaluate). A
+# mate found n plies from the root scores MATE_SCORE - n for the winner.
+MATE_SCORE = 100000
+_MATE_BOUND = MATE_SCORE - 1000
+# the clock is read every _TIME_CHECK_NODES + 1 nodes, a few milliseconds at this engine's speed
+_TIME_CHECK_NODES = 63
+# how many times along one line quiescence searches every evasion of a side in check; a move out of check can give
+# check back, so without a limit two sides checking each other in turn never reach a quiet position
+_QUIESCENCE_EVASIONS = 4
+# move ordering: the hash (or root) move, then captures by most valuable victim / least valuable attacker, then the
+# killer moves of the ply, then the rest by history score
+_FIRST_MOVE_ORDER = 1 << 30
+_CAPTURE_ORDER = 1 << 24
+_KILLER_ORDER = 1 << 22
+_HISTORY_LIMIT = (1 << 22) - 1
+
+
+# transposition table entry data, packed into one 64-bit word:
+# move (13 bits) | depth (8 bits) | bound (2 bits) | score + _TT_SCORE_OFFSET (18 bits) | generation (8 bits)
+EXACT, LOWER, UPPER = 1, 2, 3
+_TT_DEPTH_SHIFT = 13
+_TT_BOUND_SHIFT = 21
+_TT_SCORE_SHIFT = 23
+_TT_GENERATION_SHIFT = 41
+_TT_SCORE_OFFSET = 1 << 17
+_TT_BUCKET_WORDS = 4
+_KEY_MASK = (1 << 64) - 1
+
+
+def table_words(size_mb: float):
+    """Returns how many 64-bit words a TranspositionTable of size_mb megabytes uses: a power of two number of
+    buckets, as many as fit
+    Args:
+        size_mb: float
+    Returns: int"""
+    buckets = 1
+    while buckets * 2 * _TT_BUCKET_WORDS * 8 <= size_mb * (1 << 20):
+        buckets *= 2
+    return buckets * _TT_BUCKET_WORDS
+
+
+class TranspositionTable:
+    """Fixed-size table of search results keyed by Zobrist key, kept in one flat array of 64-bit words so its memory
+    use is set once by size_mb and never grows. Each bucket holds two entries of two words (key and data): the first
+    is depth-preferred and only gives way to a deeper (or as deep) search, a search from an earlier generation or the
+    same position; the second is always replaced. The key word is stored xored with the data word, so an entry whose
+    two words don't belong together (say, half written) just fails to match. That also makes it safe to share
+    between processes without locks: given a buffer (a 64-bit word memoryview of shared memory, see
+    ParallelSearch) the table lives there instead of in its own array."""
+
+    def __init__(self, size_mb: float = 16, buffer: memoryview = None, generation: int = 0):
+        """Args:
+            size_mb: float
+            buffer: memoryview | None
+                format "Q", at least table_words(size_mb) long
+            generation: int
+                the generation to go on from, so processes sharing a buffer age entries alike
+        """
+        words = table_words(size_mb)
+        self.size_mb = size_mb
+        self._mask = words // _TT_BUCKET_WORDS - 1
+        if buffer is None:
+            self._words = array("Q", bytes(words * 8))
+        else:
+            self._words = buffer[:words]
+        self._generation = generation & 0xFF
+
+    def __len__(self):
+        """Returns the number of entries the table can hold"""
+        return (self._mask + 1) * 2
+
+    def clear(self):
+        """Empties the table
+        Returns: None"""
+        memoryview(self._words).cast("B")[:] = bytes(len(self._words) * 8)
+
+    def release(self):
+        """Lets go of a shared buffer, which can't be closed while the table still holds a view of it
+        Returns: None"""
+        if isinstance(self._words, memoryview):
+            self._words.release()
+
+    def new_search(self):
+        """Ages what's in the table: entries from earlier searches give way in the depth-preferred slots
+        Returns: None"""
+        self._generation = (self._generation + 1) & 0xFF
+
+    def probe(self, key: int):
+        """Returns (move, depth, bound, score) stored for the key, or None. move is an encoded move (0 for none) and
+        bound is EXACT, LOWER or UPPER.
+        Args:
+            key: int
+        Returns: tuple | None"""
+        words = self._words
+        index = (key & self._mask) * _TT_BUCKET_WORDS
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                return (data & MOVE_MASK, data >> _TT_DEPTH_SHIFT & 0xFF, data >> _TT_BOUND_SHIFT & 3,
+                        (data >> _TT_SCORE_SHIFT & 0x3FFFF) - _TT_SCORE_OFFSET)
+        return None
+
+    def store(self, key: int, move: int, depth: int, bound: int, score: int):
+        """Stores a search result for the key
+        Args:
+            key: int
+            move: int
+                encoded move, 0 for none
+            depth: int
+            bound: int
+            score: int
+        Returns: None"""
+        words = self._words
+        index = (key & self._mask) * _TT_BUCKET_WORDS
+        data = (move | depth << _TT_DEPTH_SHIFT | bound << _TT_BOUND_SHIFT
+                | (score + _TT_SCORE_OFFSET) << _TT_SCORE_SHIFT | self._generation << _TT_GENERATION_SHIFT)
+        stored = words[index + 1]
+        if (not stored or words[index] ^ stored == key
+                or stored >> _TT_GENERATION_SHIFT != self._generation
+                or depth >= stored >> _TT_DEPTH_SHIFT & 0xFF):
+            slot = index
+        else:
+            slot = index + 2
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    def usage(self):
+        """Returns the share of entries written during the current search
+        Returns: float"""
+        words = self._words
+        generation = self._generation
+        used = sum(1 for slot in range(1, len(words), 2)
+                   if words[slot] and words[slot] >> _TT_GENERATION_SHIFT == generation)
+        return used / len(self)
+
+
+def _is_pass(move: int):
+    """Returns True if the encoded move goes from a space to itself"""
+    curr_space, new_space = divmod(move & MOVE_MASK, OFF_BOARD)
+    return curr_space == new_space
+
+
+class _SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out"""
+    pass
+
+
+class Search:
+    """Negamax alpha-beta search with iterative deepening, played out on the board with make/unmake. On a timeout the
+    board is unmade back to where it started. Results are kept in a TranspositionTable when one is given. Moves are
+    ordered (see order_moves) unless ordering is False, which only puts the hash move first; the cutoff counters show what ordering buys. With quiescence the horizon is
+    extended by captures (and evasions when in check) until the position is quiet, see _quiesce.
+
+    Null-move pruning uses the pass, which is a legal move in Janggi: if passing still fails high when searched
+    null_move_reduction (plus one more every 6 plies of depth) plies shallower, the node is cut. Late move reductions
+    search quiet moves from the late_move_index-th on late_move_reduction plies shallower with a null window, and
+    search them again at full depth if they beat alpha. A reduction of 0 turns either off."""
+
+    def __init__(self, board: Board, table: TranspositionTable = None, ordering: bool = True,
+                 quiescence: bool = True, null_move_reduction: int = 2, late_move_reduction: int = 1,
+                 late_move_index: int = 3, stop: memoryview = None):
+        """Args:
+            board: JanggiGame.Board
+            table: JanggiGame.TranspositionTable | None
+            ordering: bool
+            quiescence: bool
+            null_move_reduction: int
+            late_move_reduction: int
+            late_move_index: int
+            stop: memoryview | None
+                one word another process sets to non-zero to stop the search, like running out of time
+        """
+        self._board = board
+        self._table = table
+        self._stop = stop
+        self._limited = False
+        self._ordering = ordering
+        self._quiescence = quiescence
+        self._null_move_reduction = null_move_reduction
+        self._late_move_reduction = late_move_reduction
+        self._late_move_index = late_move_index
+        self._deadline = None
+        self._pv = []
+        self._root_move = None
+        self._root_score = 0
+        self._killers = []
+        # history scores by (piece class, color) and destination, like ZOBRIST_KEYS
+        self._history = {kind: [0] * (OFF_BOARD + 1) for kind in ZOBRIST_KEYS}
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hash_cutoffs = 0
+        self.null_move_cutoffs = 0
+        self.reduced_moves = 0
+        self.re_searches = 0
+
+    def order_moves(self, moves: list, color: str, ply: int, first_move: tuple = None):
+        """Sorts moves in place, most promising first: first_move, captures by victim value and then by cheapest
+        attacker, the ply's killer moves (quiet moves that caused a cutoff at this ply before) and the remaining
+        quiet moves by history score (how often and how deep the piece moving there caused cutoffs)
+        Args:
+            moves: list of (curr_space, new_space)
+            color: str
+            ply: int
+            first_move: (curr_space, new_space) | None
+        Returns: None"""
+        spaces = self._board.spaces
+        killers = self._killers[ply]
+        history = self._history
+
+        def order(move):
+            if move == first_move:
+                return _FIRST_MOVE_ORDER
+            curr_space, new_space = move
+            piece = spaces[curr_space]
+            victim = spaces[new_space]
+            if victim is not None and curr_space != new_space:
+                return _CAPTURE_ORDER + PIECE_VALUES[type(victim)] * 16 - PIECE_VALUES[type(piece)] // 100
+            if move in killers:
+                return _KILLER_ORDER - killers.index(move)
+            return history[type(piece), color][new_space]
+        moves.sort(key=order, reverse=True)
+
+    def _record_cutoff(self, move: tuple, color: str, depth: int, ply: int):
+        """Remembers a quiet move that caused a cutoff as a killer of the ply and in the history table"""
+        curr_space, new_space = move
+        spaces = self._board.spaces
+        if spaces[new_space] is not None and curr_space != new_space:
+            return
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        scores = self._history[type(spaces[curr_space]), color]
+        scores[new_space] += depth * depth
+        if scores[new_space] > _HISTORY_LIMIT:
+            for table in self._history.values():
+                for space in range(len(table)):
+                    table[space] //= 2
+
+    def evaluate(self, color: str):
+        """Returns the static evaluation from color's side (see Board.evaluate)
+        Returns: int"""
+        return self._board.evaluate(color)
+
+    def run(self, color: str, time_limit_ms: int = None, max_depth: int = 64, start_depth: int = 1):
+        """Searches color's moves one ply deeper at a time until max_depth, a forced mate or the time limit (or the
+        stop word). Only the first root move searched is exempt from the time limit, so there is a move to return
+        whenever color has one: if time runs out before the first iteration is done, the best move it found so far
+        comes back with depth 0. Any later unfinished iteration is thrown away.
+        Args:
+            color: str
+            time_limit_ms: int | None
+            max_depth: int
+            start_depth: int
+        Returns: dict with the best move (a (curr_space, new_space) pair or None), its score, the principal
+            variation, the depth reached, nodes searched (and how many of them in quiescence), beta cutoffs (how many
+            came from the first move tried, how many straight from the transposition table, how many from a null
+            move), late moves reduced (and searched again), seconds taken and nodes per second"""
         board = self._board
-        for space in [self.get_forward_space(), self.get_left_space(), self.get_right_space()]:
-            if board.valid_space(space):
-                attacking_spaces.append(space)
-        return attacking_spaces
+        root_ply = board._ply
+        start = time.perf_counter()
+        self._deadline = None if time_limit_ms is None else start + time_limit_ms / 1000
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.hash_cutoffs = 0
+        self.null_move_cutoffs = 0
+        self.reduced_moves = 0
+        self.re_searches = 0
+        self._pv = [[] for _ in range(max_depth + 1)]
+        self._killers = [[None, None] for _ in range(max_depth + 1)]
+        self._root_move = None
+        result = {"move": None, "score": 0, "pv": [], "depth": 0}
+        if self._table is not None:
+            self._table.new_search()
+        try:
+            for depth in range(start_depth, max_depth + 1):
+                # _negamax turns the limit on after the first root move when there is no move to fall back on yet
+                self._limited = result["move"] is not None
+                try:
+                    score = self._negamax(color, depth, -MATE_SCORE, MATE_SCORE, 0)
+                except _SearchTimeout:
+                    while board._ply > root_ply:
+                        board.unmake()
+                    if result["move"] is None and self._pv[0]:
+                        pv = self._pv[0]
+                        result = {"move": pv[0], "score": self._root_score, "pv": list(pv), "depth": 0}
+                    break
+                pv = self._pv[0]
+                self._root_move = pv[0] if pv else None
+                result = {"move": self._root_move, "score": score, "pv": list(pv), "depth": depth}
+                if self._root_move is None or abs(score) >= _MATE_BOUND:
+                    break
+        finally:
+            self._limited = False
+        seconds = time.perf_counter() - start
+        result["nodes"] = self.nodes
+        result["quiescence_nodes"] = self.quiescence_nodes
+        result["cutoffs"] = self.cutoffs
+        result["first_move_cutoffs"] = self.first_move_cutoffs
+        result["hash_cutoffs"] = self.hash_cutoffs
+        result["null_move_cutoffs"] = self.null_move_cutoffs
+        result["reduced_moves"] = self.reduced_moves
+        result["re_searches"] = self.re_searches
+        result["seconds"] = seconds
+        result["nodes_per_second"] = round(self.nodes / seconds) if seconds else 0
+        return result
+
+    def _out_of_time(self):
+        """Returns True once the deadline has passed or the stop word is set"""
+        return (self._deadline is not None and time.perf_counter() > self._deadline
+                or self._stop is not None and self._stop[0] != 0)
+
+    def _quiesce(self, color: str, alpha: int, beta: int, ply: int, evasions: int = _QUIESCENCE_EVASIONS):
+        """Searches captures only, from the horizon on, so a position isn't scored halfway through an exchange. The
+        side to move may stand pat on the static evaluation instead of capturing, and captures the static exchange
+        evaluator says lose material are skipped. A side in check can't stand pat and searches all its evasions, the
+        first evasions times along a line; after that it is scored like a side out of check."""
+        self.nodes += 1
+        self.quiescence_nodes += 1
+        if self._limited and not self.nodes & _TIME_CHECK_NODES and self._out_of_time():
+            raise _SearchTimeout
+        board = self._board
+        spaces = board.spaces
+        opponent = OPPONENT[color]
+        if evasions and board.is_attacked(board.get_general(color).space, opponent):
+            moves = list(board.generate_evasions(color))
+            if not moves:
+                return ply - MATE_SCORE
+            best = -MATE_SCORE
+            evasions -= 1
+        else:
+            best = self.evaluate(color)
+            if best >= beta:
+                return best
+            if best > alpha:
+                alpha = best
+            moves = [move for move in board.generate_legal_moves(color, captures_only=True)
+                     if board.static_exchange(encode_move(*move)) >= 0]
+
+        def order(move):
+            curr_space, new_space = move
+            victim = spaces[new_space]
+            if victim is None or curr_space == new_space:
+                return 0
+            return PIECE_VALUES[type(victim)] * 16 - PIECE_VALUES[type(spaces[curr_space])] // 100
+        moves.sort(key=order, reverse=True)
+        for move in moves:
+            board.make(encode_move(*move))
+            score = -self._quiesce(opponent, -beta, -alpha, ply + 1, evasions)
+            board.unmake()
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best
+
+    def _negamax(self, color: str, depth: int, alpha: int, beta: int, ply: int):
+        self.nodes += 1
+        if self._limited and not self.nodes & _TIME_CHECK_NODES and self._out_of_time():
+            raise _SearchTimeout
+        pv = self._pv
+        pv[ply] = []
+        if depth == 0:
+            if self._quiescence:
+                self.nodes -= 1
+                return self._quiesce(color, alpha, beta, ply)
+            return self.evaluate(color)
+        board = self._board
+        table = self._table
+        key = board.zobrist_key
+        hash_move = None
+        if table is not None:
+            entry = table.probe(key)
+            if entry is not None:
+                move, entry_depth, bound, score = entry
+                if move:
+                    hash_move = decode_move(move)
+                # the root always searches, so that it has a move and a principal variation to report
+                if ply and entry_depth >= depth:
+                    # mate scores are stored relative to the position, not to the root
+                    if score >= _MATE_BOUND:
+                        score -= ply
+                    elif score <= -_MATE_BOUND:
+                        score += ply
+                    if (bound == EXACT or bound == LOWER and score >= beta
+                            or bound == UPPER and score <= alpha):
+                        self.hash_cutoffs += 1
+                        return score
+        opponent = OPPONENT[color]
+        general_space = board.get_general(color).space
+        in_check = board.is_attacked(general_space, opponent)
+        reduction = self._null_move_reduction
+        if reduction and ply and not in_check and depth > reduction and beta < _MATE_BOUND:
+            last_move = board.last_move()
+            # two passes in a row would only search the same position shallower
+            if last_move is None or not _is_pass(last_move):
+                board.make(encode_move(general_space, general_space))
+                score = -self._negamax(opponent, depth - 1 - reduction - depth // 6, -beta, 1 - beta, ply + 1)
+                board.unmake()
+                if score >= beta:
+                    self.null_move_cutoffs += 1
+                    return beta if score >= _MATE_BOUND else score
+        moves = list(board.generate_legal_moves(color))
+        if not moves:
+            # only a side in check can run out of moves, everyone else can pass
+            return ply - MATE_SCORE
+        first_move = self._root_move if ply == 0 else hash_move
+        if self._ordering:
+            self.order_moves(moves, color, ply, first_move)
+        elif first_move is not None and first_move in moves:
+            moves.remove(first_move)
+            moves.insert(0, first_move)
+        spaces = board.spaces
+        killers = self._killers[ply]
+        late_move_reduction = self._late_move_reduction
+        reduce_late_moves = late_move_reduction and depth >= 3 and not in_check
+        original_alpha = alpha
+        best = -MATE_SCORE
+        best_move = None
+        for index, move in enumerate(moves):
+            if not ply and index:
+                # a root move has been searched, so there is something to return if time runs out
+                self._limited = True
+            curr_space, new_space = move
+            reduce = (reduce_late_moves and index >= self._late_move_index and move not in killers
+                      and (spaces[new_space] is None or curr_space == new_space))
+            board.make(encode_move(curr_space, new_space))
+            # moves that give check aren't reduced
+            if reduce and not board.attackers_of(board.get_general(opponent).space, color):
+                self.reduced_moves += 1
+                score = -self._negamax(opponent, max(depth - 1 - late_move_reduction, 0), -alpha - 1, -alpha,
+                                       ply + 1)
+                if score > alpha:
+                    self.re_searches += 1
+                    score = -self._negamax(opponent, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self._negamax(opponent, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake()
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[ply] = [move] + pv[ply + 1]
+                    if not ply:
+                        self._root_score = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if not index:
+                            self.first_move_cutoffs += 1
+                        if self._ordering:
+                            self._record_cutoff(move, color, depth, ply)
+                        break
+        if table is not None:
+            bound = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+            stored_score = best + ply if best >= _MATE_BOUND else best - ply if best <= -_MATE_BOUND else best
+            table.store(key, encode_move(*best_move), depth, bound, stored_score)
+        return best
+
+
+
+def _parallel_helper(board: bytes, color: str, memory_name: str, words: int, generation: int, time_limit_ms: int,
+                     max_depth: int, index: int, search_options: dict):
+    """Runs one ParallelSearch helper in a pool process, on its own copy of the board (pickled) and the shared
+    table. Odd helpers skip depth 1 so they drift a ply ahead of the others and fill the table with different
+    entries.
+    Returns: dict (see Search.run)"""
+    board = pickle.loads(board)
+    memory = shared_memory.SharedMemory(name=memory_name)
+    view = memory.buf.cast("Q")
+    table = TranspositionTable(words * 8 / (1 << 20), view[:words], generation)
+    stop = view[words:words + 1]
+    try:
+        return Search(board, table, stop=stop, **search_options).run(color, time_limit_ms, max_depth,
+                                                                     1 + index % 2)
+    finally:
+        table.release()
+        stop.release()
+        view.release()
+        memory.close()
+
+
+def _close_parallel(pool: ProcessPoolExecutor, memory: shared_memory.SharedMemory, views: tuple):
+    """Shuts a ParallelSearch's pool down and frees its shared block, once the views of the block are let go. Kept
+    apart from the class so its finalizer doesn't hold on to the instance."""
+    if pool is not None:
+        pool.shutdown()
+    for view in views:
+        view.release()
+    memory.close()
+    memory.unlink()
+
+
+class ParallelSearch:
+    """Lazy SMP: the same iterative deepening search run at once by this process and workers - 1 helper processes,
+    all sharing one TranspositionTable in shared memory, so what one of them finds the others read instead of
+    searching again. The table needs no locks (see TranspositionTable). When this process's search is done a stop
+    word in the shared block tells the helpers to give up, and the deepest finished iteration wins. The pool and the
+    shared block live until close (or the end of a with block), or until the instance is garbage collected or the
+    interpreter exits, whichever comes first."""
+
+    def __init__(self, workers: int, hash_mb: float = 16):
+        """Args:
+            workers: int
+                processes searching, this one included
+            hash_mb: float
+        """
+        self.workers = workers
+        self.hash_mb = hash_mb
+        self._words = table_words(hash_mb)
+        # the table words followed by the stop word
+        self._memory = shared_memory.SharedMemory(create=True, size=(self._words + 1) * 8)
+        self._view = self._memory.buf.cast("Q")
+        self._stop = self._view[self._words:self._words + 1]
+        self.table = TranspositionTable(hash_mb, self._view[:self._words])
+        self.table.clear()
+        self._pool = ProcessPoolExecutor(workers - 1) if workers > 1 else None
+        self._finalizer = weakref.finalize(self, _close_parallel, self._pool, self._memory,
+                                           (self.table._words, self._stop, self._view))
+
+    def run(self, board: Board, color: str, time_limit_ms: int = None, max_depth: int = 64, **search_options):
+        """Searches color's moves on board (see Search.run). Other keyword arguments go to every Search.
+        Args:
+            board: JanggiGame.Board
+            color: str
+            time_limit_ms: int | None
+            max_depth: int
+        Returns: dict like Search.run's, with nodes summed over all the processes, plus workers and the depth each
+            of them reached (this process's first)"""
+        self._stop[0] = 0
+        generation = self.table._generation
+        # pickled here rather than by the pool, which does it on another thread while this one is already searching
+        snapshot = pickle.dumps(board)
+        helpers = [self._pool.submit(_parallel_helper, snapshot, color, self._memory.name, self._words, generation,
+                                     time_limit_ms, max_depth, index, search_options)
+                   for index in range(1, self.workers)] if self._pool is not None else []
+        try:
+            result = Search(board, self.table, **search_options).run(color, time_limit_ms, max_depth)
+        finally:
+            self._stop[0] = 1
+            helper_results = [helper.result() for helper in helpers]
+        best = result
+        for helper_result in helper_results:
+            if helper_result["depth"] > best["depth"] and helper_result["move"] is not None:
+                best = helper_result
+        best = dict(best, seconds=result["seconds"])
+        best["nodes"] = result["nodes"] + sum(helper_result["nodes"] for helper_result in helper_results)
+        best["nodes_per_second"] = round(best["nodes"] / best["seconds"]) if best["seconds"] else 0
+        best["workers"] = self.workers
+        best["worker_depths"] = [result["depth"]] + [helper_result["depth"] for helper_result in helper_results]
+        return best
+
+    def close(self):
+        """Shuts the pool down and frees the shared block. Calling it again does nothing."""
+        self._finalizer()
+        self._pool = None
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# reason codes passed to EventSink.move_rejected
+GAME_OVER = "GAME_OVER"
+PASS_IN_CHECK = "PASS_IN_CHECK"
+NOT_YOUR_PIECE = "NOT_YOUR_PIECE"
+ILLEGAL_MOVE = "ILLEGAL_MOVE"
+EXPOSES_GENERAL = "EXPOSES_GENERAL"
+# only reported by JanggiGame.replay, for a move that isn't two valid spaces
+NOT_A_MOVE = "NOT_A_MOVE"
+
+
+class EventSink:
+    """Receives what happens in a JanggiGame. Every method does nothing, so this is the default sink and a game
+    that nobody watches pays nothing for it. Subclass it and override the events you care about."""
+
+    def move_accepted(self, game, current_space: str, new_space: str):
+        """Called after a move (or a pass, where both spaces are the general's) is made and the turn has changed"""
+        pass
+
+    def move_rejected(self, game, current_space: str, new_space: str, reason: str):
+        """Called when make_move refuses a move. reason is one of GAME_OVER, PASS_IN_CHECK, NOT_YOUR_PIECE,
+        ILLEGAL_MOVE and EXPOSES_GENERAL"""
+        pass
+
+    def check(self, game, color: str):
+        """Called when a move puts color's general in check without mating it"""
+        pass
+
+    def game_over(self, game, game_state: str):
+        """Called once, when a move ends the game (game_state is "BLUE_WON" or "RED_WON")"""
+        pass
+
+
+class _ReplaySink(EventSink):
+    """Keeps what JanggiGame.replay needs to know about the last move"""
+
+    def __init__(self):
+        self.reason = None
+        self.gave_check = False
+
+    def move_rejected(self, game, current_space: str, new_space: str, reason: str):
+        self.reason = reason
+
+    def check(self, game, color: str):
+        self.gave_check = True
+
+
+class ConsoleSink(EventSink):
+    """Writes the events to a stream (stdout by default) the way make_move used to print them. Lines are held back
+    and written batch_size events at a time, and the board is only rendered when a batch is written, once, for the
+    latest position. The default batch_size of 1 prints the board after every move. Call flush at the end of a game
+    to write whatever is still held back."""
+
+    _REASONS = {
+        GAME_OVER: "someone won",
+        PASS_IN_CHECK: "can't pass while in check",
+        NOT_YOUR_PIECE: "no piece there or not your turn",
+        ILLEGAL_MOVE: "not legal move",
+        EXPOSES_GENERAL: "move exposes general",
+    }
+
+    def __init__(self, stream=None, batch_size: int = 1, show_board: bool = True):
+        """Args:
+            stream: file-like object, None for stdout
+            batch_size: int
+            show_board: bool
+        """
+        self._stream = stream
+        self._batch_size = batch_size
+        self._show_board = show_board
+        self._lines = []
+        self._events = 0
+        self._board = None
+
+    def _add(self, *lines):
+        self._lines.extend(lines)
+        self._events += 1
+        if self._events >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the held back lines, followed by the board if a move was made since the last flush"""
+        if self._board is not None:
+            self._lines.append(format_board(self._board))
+            self._board = None
+        if self._lines:
+            print("\n".join(self._lines), file=self._stream)
+        self._lines = []
+        self._events = 0
+
+    def move_accepted(self, game, current_space: str, new_space: str):
+        if self._show_board and current_space != new_space:
+            self._board = game._board
+        self._add(current_space + " " + new_space)
+
+    def move_rejected(self, game, current_space: str, new_space: str, reason: str):
+        self._add(str(current_space) + " " + str(new_space), self._REASONS[reason])
+
+    def check(self, game, color: str):
+        self._add(color + " is in check")
+
+    def game_over(self, game, game_state: str):
+        self._add(game_state)
+
 
 class JanggiGame:
     
-    def __init__(self):
-        self._board = Board()
+    def __init__(self, sink: EventSink = None, fen: str = None):
+        """Args:
+            sink: JanggiGame.EventSink
+                receives moves, rejections, checks and the end of the game; nothing is printed by default
+            fen: str | None
+                the position to start from instead of the usual setup (see parse_fen)
+        """
         self._turn = "blue"
         self._game_state = "UNFINISHED"
+        # plies since the last capture and the move number, only kept for to_fen
+        self._halfmove = 0
+        self._fullmove = 1
+        if fen is None:
+            self._board = Board()
+        else:
+            setup, self._turn, self._halfmove, self._fullmove = parse_fen(fen)
+            board = self._board = Board(setup)
+            if self._turn == "red":
+                board.toggle_side()
+            opponent = OPPONENT[self._turn]
+            if board.attackers_of(board.get_general(opponent).space, self._turn):
+                raise FenError(f"{fen!r} leaves {opponent}, who isn't to move, in check")
+            general = board.get_general(self._turn)
+            if general.in_check() and general.in_checkmate():
+                self._game_state = opponent.upper() + "_WON"
+        self._sink = EventSink() if sink is None else sink
+        self._table = None
+        self._parallel = None
+
+    @classmethod
+    def from_fen(cls, fen: str, sink: EventSink = None):
+        """Starts a game from a FEN position (see parse_fen). A side to move that is already mated has lost.
+        Raises FenError for a string that isn't a legal position.
+        Args:
+            fen: str
+            sink: JanggiGame.EventSink
+        Returns: JanggiGame"""
+        return cls(sink, fen)
+
+    def to_fen(self):
+        """Returns the position as a FEN string (see parse_fen)
+        Returns: str"""
+        return board_fen(self._board, self._turn, self._halfmove, self._fullmove)
+
+    def set_sink(self, sink: EventSink):
+        """Replaces the event sink (None for the default one that does nothing)"""
+        self._sink = EventSink() if sink is None else sink
 
     def view(self):
         """prints the board"""
@@ -850,6 +2118,7 @@ class JanggiGame:
             self._turn = "red"
         else:
             self._turn = "blue"
+            self._fullmove += 1
 
     def make_move(self, current_space:str, new_space:str):
         """each player uses this method for moving pieces. Returns True id move was successful/legal
@@ -857,60 +2126,322 @@ class JanggiGame:
             current_space: str
             new_space: str
         Returns: True | False"""
-        print(current_space, new_space)
+        sink = self._sink
         if self._game_state != "UNFINISHED":
-            print("someone won")
+            sink.move_rejected(self, current_space, new_space, GAME_OVER)
             return False
         if current_space == new_space:
+            # passing doesn't get a general out of check
+            if self.is_in_check(self._turn):
+                sink.move_rejected(self, current_space, new_space, PASS_IN_CHECK)
+                return False
+            self._board.toggle_side()
+            self._halfmove += 1
             self.change_turn()
+            sink.move_accepted(self, current_space, new_space)
             return True
-        piece = self._board.get_piece(current_space)
+        # algebraic names stop here, everything below works with space indexes
+        piece = self._board.get_piece(space_index(current_space))
         if piece is None or piece.color != self._turn:
-            print("no piece there or not your turn")
+            sink.move_rejected(self, current_space, new_space, NOT_YOUR_PIECE)
             return False
         legal_spaces = piece.get_legal_moves()
-        if new_space not in legal_spaces:
-            print("not legal move")
+        new_index = _SPACE_INDEXES.get(new_space)
+        if new_index not in legal_spaces:
+            sink.move_rejected(self, current_space, new_space, ILLEGAL_MOVE)
             return False
-        move = piece.move(new_space)
-        move.commit()
+        board = self._board
+        move = encode_move(piece.space, new_index)
         # make sure move doesn't put player's general in check
-        if self.is_in_check(self._turn):
-            move.revert()
-            print("move exposes general")
+        if board.exposes_general(move, self._turn):
+            sink.move_rejected(self, current_space, new_space, EXPOSES_GENERAL)
             return False
+        self._halfmove = 0 if board.spaces[new_index] is not None else self._halfmove + 1
+        board.make(move)
         # update game state
-        if self._board.get_opponent_general(self._turn).in_checkmate():
+        opponent_general = board.get_opponent_general(self._turn)
+        in_check = opponent_general.in_check()
+        if in_check and opponent_general.in_checkmate():
             self._game_state = self._turn.upper()+"_WON"
         self.change_turn()
-        print_board(self._board)
+        sink.move_accepted(self, current_space, new_space)
+        if self._game_state != "UNFINISHED":
+            sink.game_over(self, self._game_state)
+        elif in_check:
+            sink.check(self, self._turn)
         return True
     
     def is_in_check(self, color:str):
         """returns True if player is in check"""
-        general = self._board.get_general(color)
-        return general.in_check()
+        board = self._board
+        return board.is_attacked(board.get_general(color).space, OPPONENT[color])
 
     def get_game_state(self):
         """returns the game state"""
         return self._game_state
+
+    def legal_moves(self):
+        """Yields the legal moves of the player whose turn it is as (current_space, new_space) pairs of algebraic
+        names, in the form make_move takes them. The last one is the pass unless the player is in check. Nothing is
+        yielded once the game is over.
+        Returns: generator"""
+        if self._game_state != "UNFINISHED":
+            return
+        for curr_space, new_space in self._board.generate_legal_moves(self._turn):
+            yield space_name(curr_space), space_name(new_space)
+
+    def replay(self, moves):
+        """Plays a game record from the current position, one move at a time as it is read, and stops at the first
+        move make_move refuses. moves may be any iterable of (current_space, new_space) pairs or of lines (see
+        parse_move, blank lines are skipped), an open file for instance. Nothing goes to the event sink while it
+        runs.
+        Args:
+            moves: iterable
+        Returns: dict with the game state, the plies played, and the ply (from 0) of the refused move, the move and
+            why (see EventSink.move_rejected, or NOT_A_MOVE), all None if every move was played"""
+        result = {"game_state": self._game_state, "plies": 0, "illegal_ply": None, "illegal_move": None,
+                  "reason": None}
+        for ply in self._replay(moves):
+            if ply[2] is not None:
+                result["illegal_ply"], result["illegal_move"], result["reason"] = ply[:3]
+            else:
+                result["plies"] += 1
+        result["game_state"] = self._game_state
+        return result
+
+    def replay_plies(self, moves):
+        """replay one ply at a time: yields a dict for each move as it is played, with its ply (from 0), the move,
+        whether it was accepted, why not (see replay), whether it gave check and the game state after it. The last
+        one yielded is the first refused move, if any.
+        Args:
+            moves: iterable
+        Returns: generator"""
+        for ply, move, reason, gave_check in self._replay(moves):
+            yield {"ply": ply, "move": move, "accepted": reason is None, "reason": reason, "check": gave_check,
+                   "game_state": self._game_state}
+
+    def _replay(self, moves):
+        """Yields (ply, move, rejection reason or None, gave check) for each move of replay"""
+        sink = _ReplaySink()
+        previous_sink, self._sink = self._sink, sink
+        try:
+            ply = 0
+            for move in moves:
+                try:
+                    if isinstance(move, str):
+                        move = parse_move(move)
+                        if move is None:
+                            continue
+                    # anything but a pair of names is refused here, so errors from make_move itself aren't hidden
+                    if (not isinstance(move, (tuple, list)) or len(move) != 2
+                            or not all(isinstance(space, str) for space in move)):
+                        raise SpaceError(f"{move!r} is not a move")
+                    accepted = self.make_move(*move)
+                except SpaceError:
+                    accepted = False
+                    sink.reason = NOT_A_MOVE
+                if not accepted:
+                    yield ply, move, sink.reason, False
+                    return
+                yield ply, move, None, sink.gave_check
+                sink.gave_check = False
+                ply += 1
+        finally:
+            self._sink = previous_sink
+
+    def perft(self, depth: int, bulk: bool = True, hashed: bool = False, reference: bool = False):
+        """Counts the leaves of the legal move tree depth plies deep from the current position (passes included).
+        See Board.perft for bulk; hashed reuses subtree counts by Zobrist key. reference counts with the slow move
+        generator (see Board.generate_reference_moves), to check the fast one against. Returns 0 for a finished game.
+        Args:
+            depth: int
+            bulk: bool
+            hashed: bool
+            reference: bool
+        Returns: int"""
+        return sum(self.divide(depth, bulk, hashed, reference).values()) if depth > 0 else 1
+
+    def divide(self, depth: int, bulk: bool = True, hashed: bool = False, reference: bool = False):
+        """perft split by the first move: a dict from each legal (current_space, new_space) pair to the leaf count
+        below it, in move generator order. Comparing the divides of the two move generators (see reference in
+        perft) is how a disagreement between them is narrowed down to one move.
+        Args:
+            depth: int
+            bulk: bool
+            hashed: bool
+            reference: bool
+        Returns: dict"""
+        counts = {}
+        if self._game_state != "UNFINISHED" or depth < 1:
+            return counts
+        board = self._board
+        opponent = OPPONENT[self._turn]
+        table = {} if hashed else None
+        generate = board.generate_reference_moves if reference else board.generate_legal_moves
+        for curr_space, new_space in generate(self._turn):
+            board.make(encode_move(curr_space, new_space))
+            counts[space_name(curr_space), space_name(new_space)] = board.perft(opponent, depth - 1, bulk, table,
+                                                                                reference)
+            board.unmake()
+        return counts
+
+    def position_key(self):
+        """Returns the 64-bit Zobrist key of the position (pieces and side to move). Equal positions reached by
+        different move orders have equal keys.
+        Returns: int"""
+        return self._board.zobrist_key
+
+    def best_move(self, time_limit_ms: int = 1000, max_depth: int = 64, hash_mb: float = 16, workers: int = 1,
+                  **search_options):
+        """Searches for the best move of the player whose turn it is (see Search.run). The move and the principal
+        variation come back as algebraic (current_space, new_space) pairs, ready for make_move. Returns None once the
+        game is over. The game keeps a transposition table of hash_mb megabytes between calls (None searches without
+        one). With more than one worker the search runs in that many processes sharing the table (see
+        ParallelSearch); the game keeps the pool until close_search. Other keyword arguments tune the search (see
+        Search), e.g. null_move_reduction=0.
+        Args:
+            time_limit_ms: int | None
+            max_depth: int
+            hash_mb: float | None
+            workers: int
+        Returns: dict | None"""
+        if self._game_state != "UNFINISHED":
+            return None
+        if workers > 1:
+            hash_mb = 16 if hash_mb is None else hash_mb
+            parallel = self._parallel
+            if parallel is not None and (parallel.workers != workers or parallel.hash_mb != hash_mb):
+                self.close_search()
+            if self._parallel is None:
+                self._parallel = ParallelSearch(workers, hash_mb)
+            result = self._parallel.run(self._board, self._turn, time_limit_ms, max_depth, **search_options)
+        else:
+            if hash_mb is None:
+                self._table = None
+            elif self._table is None or self._table.size_mb != hash_mb:
+                self._table = TranspositionTable(hash_mb)
+            result = Search(self._board, self._table, **search_options).run(self._turn, time_limit_ms, max_depth)
+        result["pv"] = [(space_name(curr_space), space_name(new_space)) for curr_space, new_space in result["pv"]]
+        if result["move"] is not None:
+            result["move"] = result["pv"][0]
+        return result
+
+    def close_search(self):
+        """Drops the search state best_move keeps between calls: the transposition table, and with it the process
+        pool and shared memory of a parallel search"""
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+        self._table = None
+
+    def point_count(self, color: str):
+        """Returns the player's official point count, with red's komi (see Board.point_count). It decides games that
+        are adjudicated on points.
+        Args:
+            color: str
+        Returns: float"""
+        return self._board.point_count(color)
+
+    def stats(self):
+        """Returns the instrumentation counters (see enable_stats). They are process-wide, so with several games in
+        one process they add up over all of them.
+        Returns: dict"""
+        return get_stats()
         
 
 
-def print_board(board):
+# Instrumentation. enable_stats swaps timing wrappers in for the methods below and disable_stats puts the originals
+# back, so while it is off the engine runs its plain methods and pays nothing for it. Times include nested stages
+# (make inside exposes_general, for example).
+_STATS = {}
+_ORIGINAL_METHODS = {}
 
-    for col in "abcdefghi":
-        if col == "a":
-            print("   "+col, end=" "*5)
-        else:
-            print(col, end=" "*5)
-    print()
+
+def _instrumented_methods():
+    """Returns (stage name, class, attribute) for every instrumented method"""
+    methods = [("make_move", JanggiGame, "make_move"), ("is_in_check", JanggiGame, "is_in_check"),
+               ("commit", Move, "commit"), ("revert", Move, "revert"),
+               ("make", Board, "make"), ("unmake", Board, "unmake"),
+               ("exposes_general", Board, "exposes_general"), ("attackers_of", Board, "attackers_of"),
+               ("opponents_attacking_spaces", Board, "get_opponents_attacking_spaces"),
+               ("in_check", General, "in_check"), ("in_checkmate", General, "in_checkmate")]
+    for piece_class in (General, Guard, Horse, Elephant, Chariot, Cannon, Soldier):
+        for attribute in ("get_legal_moves", "get_attacking_spaces"):
+            if attribute in vars(piece_class):
+                methods.append((piece_class.__name__ + "." + attribute, piece_class, attribute))
+    return methods
+
+
+def _instrument(record: list, method):
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def instrumented(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record[0] += 1
+            record[1] += perf_counter() - start
+    return instrumented
+
+
+def enable_stats():
+    """Starts counting calls and time spent in the stages of a move (move generation per piece type, attack sets,
+    make/unmake and commit/revert, check and checkmate tests). Does nothing if it's already on.
+    Returns: None"""
+    if _ORIGINAL_METHODS:
+        return
+    for name, owner, attribute in _instrumented_methods():
+        method = vars(owner)[attribute]
+        _ORIGINAL_METHODS[owner, attribute] = method
+        setattr(owner, attribute, _instrument(_STATS.setdefault(name, [0, 0.0]), method))
+
+
+def disable_stats():
+    """Puts the uninstrumented methods back. The counters are kept until reset_stats.
+    Returns: None"""
+    for (owner, attribute), method in _ORIGINAL_METHODS.items():
+        setattr(owner, attribute, method)
+    _ORIGINAL_METHODS.clear()
+
+
+def stats_enabled():
+    """Returns: True | False"""
+    return bool(_ORIGINAL_METHODS)
+
+
+def reset_stats():
+    """Zeroes the counters
+    Returns: None"""
+    for record in _STATS.values():
+        record[0] = 0
+        record[1] = 0.0
+
+
+def get_stats():
+    """Returns {stage: {"calls": int, "seconds": float}} for every stage called since the last reset
+    Returns: dict"""
+    return {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in _STATS.items() if calls}
+
+
+def format_board(board):
+    """Returns the board as the text print_board prints
+    Args:
+        board: JanggiGame.Board
+    Returns: str"""
+    lines = ["   " + "".join(col + " "*5 for col in "abcdefghi")]
     for row in [1,2,3,4,5,6,7,8,9,10]:
-        print("------------------------------------------------------")
+        lines.append("------------------------------------------------------")
         if row == 10:
-            print(str(row)+" "+" | ".join(["   " if v is None else str(v) for v in board.get_row(row)]))
+            lines.append(str(row)+" "+" | ".join(["   " if v is None else str(v) for v in board.get_row(row)]))
         else:
-            print(str(row)+"  "+" | ".join(["   " if v is None else str(v) for v in board.get_row(row)]))
-    print("------------------------------------------------------")
+            lines.append(str(row)+"  "+" | ".join(["   " if v is None else str(v) for v in board.get_row(row)]))
+    lines.append("------------------------------------------------------")
+    return "\n".join(lines)
+
+
+def print_board(board):
+    print(format_board(board))
 
     
\ No newline at end of file
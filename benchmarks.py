@@ -0,0 +1,374 @@
+# Benchmarks for the JanggiGame rules engine.
+#
+# Times the hot paths on the game records and positions in bench_corpus.json and prints the results as JSON, so runs
+# on different versions can be compared:
+#
+#     python benchmarks.py [--quick] [--repeat N] [--only NAME ...] [--output FILE] [--corpus FILE]
+#
+# Timings are per call in microseconds, the best and the median of the runs. Bump the corpus "version" whenever a
+# game or position in it changes; results from different corpus versions aren't comparable. Each corpus game has a
+# "source"; the "self-play" ones are the engine playing itself, not real play (see the corpus "notes"), and the results
+# list them.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import records
+from JanggiGame import (JanggiGame, Search, ParallelSearch, TranspositionTable, General, Guard, Horse, Elephant, Chariot, Cannon,
+                        Soldier, space_name, enable_stats, disable_stats, reset_stats, get_stats)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_corpus.json")
+PIECE_CLASSES = (General, Guard, Horse, Elephant, Chariot, Cannon, Soldier)
+
+
+def load_corpus(path: str = CORPUS_PATH):
+    """Reads the corpus. Games are keyed by name and their moves turned into tuples.
+    Args:
+        path: str
+    Returns: dict"""
+    with open(path) as corpus_file:
+        corpus = json.load(corpus_file)
+    corpus["games"] = {game["name"]: dict(game, moves=[tuple(move) for move in game["moves"]])
+                       for game in corpus["games"]}
+    return corpus
+
+
+def play(moves):
+    """Plays the moves from the start and returns the game. Raises ValueError on a move make_move refuses, since a
+    corpus game that no longer replays would make the timings meaningless.
+    Args:
+        moves: list of (current_space, new_space)
+    Returns: JanggiGame"""
+    game = JanggiGame()
+    for ply, move in enumerate(moves):
+        if not game.make_move(*move):
+            raise ValueError("move %d %s-%s was refused" % (ply, move[0], move[1]))
+    return game
+
+
+def positions(corpus):
+    """Yields (name, game) for each corpus position, replayed from its game record
+    Args:
+        corpus: dict
+    Returns: generator"""
+    for entry in corpus["positions"]:
+        yield entry["name"], play(corpus["games"][entry["game"]]["moves"][:entry["ply"]])
+
+
+def measure(function, repeat: int, number: int = 1):
+    """Times repeat runs of number calls to function
+    Args:
+        function: callable taking no arguments
+        repeat: int
+        number: int
+    Returns: dict"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number * 1e6)
+    return {"runs": repeat, "calls": number, "min_us": round(min(times), 2),
+            "median_us": round(statistics.median(times), 2)}
+
+
+def bench_construction(corpus, options):
+    """JanggiGame()"""
+    return measure(JanggiGame, options.repeat, 20)
+
+
+def bench_make_move(corpus, options):
+    """Replaying each game record through make_move, construction included"""
+    results = {}
+    for name, game in corpus["games"].items():
+        moves = game["moves"]
+        result = measure(lambda: play(moves), options.repeat)
+        result["moves"] = len(moves)
+        result["us_per_move"] = round(result["min_us"] / len(moves), 2)
+        results[name] = result
+    return results
+
+
+def bench_replay(corpus, options):
+    """JanggiGame.replay of each game record, from (current_space, new_space) pairs and from text lines"""
+    results = {}
+    for name, game in corpus["games"].items():
+        moves = game["moves"]
+        lines = ["%s %s\n" % move for move in moves]
+        results[name] = {}
+        for source, record in (("pairs", moves), ("lines", lines)):
+            result = measure(lambda: JanggiGame().replay(record), options.repeat)
+            result["us_per_move"] = round(result["min_us"] / len(moves), 2)
+            results[name][source] = result
+    return results
+
+
+def bench_records(corpus, options):
+    """Reading every game record back from a binary record file (see records.py) and from JSON Lines, and the
+    size of each"""
+    games = [{"moves": game["moves"], "result": game["result"]} for game in corpus["games"].values()]
+    lines = [json.dumps(game) for game in games]
+    moves = sum(len(game["moves"]) for game in games)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.jgr")
+        records.pack(games, path)
+        size = os.path.getsize(path)
+        with records.RecordReader(path) as reader:
+            binary = measure(lambda: [reader[number] for number in range(len(reader))], options.repeat, 20)
+            last_ply = measure(lambda: [reader.move(number, reader.plies(number) - 1)
+                                        for number in range(len(reader))], options.repeat, 20)
+    text = measure(lambda: [json.loads(line) for line in lines], options.repeat, 20)
+    return {
+        "records": {"bytes": size, "bytes_per_move": round(size / moves, 2), "read_all": binary,
+                    "last_ply_of_each": last_ply},
+        "json_lines": {"bytes": sum(len(line) + 1 for line in lines),
+                       "bytes_per_move": round(sum(len(line) + 1 for line in lines) / moves, 2), "read_all": text},
+    }
+
+
+def bench_pieces(corpus, options):
+    """get_legal_moves and get_attacking_spaces for every piece of each class (both colors) in each position"""
+    results = {piece_class.__name__: {} for piece_class in PIECE_CLASSES}
+    for name, game in positions(corpus):
+        board = game._board
+        pieces = board.get_pieces("blue") + board.get_pieces("red") + [board.get_general("blue"),
+                                                                        board.get_general("red")]
+        for piece_class in PIECE_CLASSES:
+            of_class = [piece for piece in pieces if type(piece) is piece_class]
+            if not of_class:
+                continue
+            result = {
+                "pieces": len(of_class),
+                "get_legal_moves": measure(lambda: [piece.get_legal_moves() for piece in of_class],
+                                           options.repeat, 20),
+            }
+            # generals don't attack (see Board.get_opponents_attacking_spaces)
+            if piece_class is not General:
+                result["get_attacking_spaces"] = measure(
+                    lambda: [piece.get_attacking_spaces() for piece in of_class], options.repeat, 20)
+            results[piece_class.__name__][name] = result
+    return results
+
+
+def bench_is_in_check(corpus, options):
+    """is_in_check for the side to move"""
+    return {name: measure(lambda: game.is_in_check(game._turn), options.repeat, 100)
+            for name, game in positions(corpus)}
+
+
+def bench_checkmate(corpus, options):
+    """in_checkmate for the side to move, including the final position of every game record"""
+    games = list(positions(corpus))
+    games += [(name + "-final", play(game["moves"])) for name, game in corpus["games"].items()]
+    results = {}
+    for name, game in games:
+        general = game._board.get_general(game._turn)
+        results[name] = measure(general.in_checkmate, options.repeat, 20)
+        results[name]["checkmate"] = general.in_checkmate()
+    return results
+
+
+def bench_perft(corpus, options):
+    """perft with bulk counting at each depth up to --perft-depth"""
+    results = {}
+    for name, game in positions(corpus):
+        results[name] = {}
+        for depth in range(1, options.perft_depth + 1):
+            nodes = game.perft(depth)
+            result = measure(lambda: game.perft(depth), options.repeat)
+            result["nodes"] = nodes
+            result["nodes_per_second"] = round(nodes / (result["min_us"] / 1e6)) if result["min_us"] else None
+            results[name]["depth %d" % depth] = result
+    return results
+
+
+def search_options(options):
+    """Returns the Search keyword arguments set on the command line"""
+    return {"null_move_reduction": options.null_move_reduction, "late_move_reduction": options.late_move_reduction,
+            "late_move_index": options.late_move_index}
+
+
+def bench_search(corpus, options):
+    """best_move to a fixed depth (--search-depth) without a time limit, so node counts are comparable across runs"""
+    results = {}
+    for name, game in positions(corpus):
+        result = game.best_move(time_limit_ms=None, max_depth=options.search_depth, **search_options(options))
+        if result is None:
+            continue
+        results[name] = {"depth": result["depth"], "move": "%s-%s" % result["move"], "score": result["score"],
+                         "nodes": result["nodes"], "quiescence_nodes": result["quiescence_nodes"],
+                         "cutoffs": result["cutoffs"],
+                         "first_move_cutoffs": result["first_move_cutoffs"], "hash_cutoffs": result["hash_cutoffs"],
+                         "null_move_cutoffs": result["null_move_cutoffs"], "reduced_moves": result["reduced_moves"],
+                         "re_searches": result["re_searches"],
+                         "ms": round(result["seconds"] * 1000, 2), "nodes_per_second": result["nodes_per_second"]}
+    return results
+
+
+def bench_ordering(corpus, options):
+    """The fixed-depth search with and without move ordering (both without a transposition table)"""
+    results = {}
+    for name, game in positions(corpus):
+        if game.get_game_state() != "UNFINISHED":
+            continue
+        results[name] = {}
+        for ordering in (False, True):
+            result = Search(game._board, ordering=ordering).run(game._turn, None, options.search_depth)
+            cutoffs = result["cutoffs"]
+            results[name]["ordered" if ordering else "unordered"] = {
+                "nodes": result["nodes"], "cutoffs": cutoffs,
+                "first_move_cutoff_rate": round(result["first_move_cutoffs"] / cutoffs, 3) if cutoffs else None,
+                "ms": round(result["seconds"] * 1000, 2)}
+    return results
+
+
+def bench_pruning(corpus, options):
+    """The fixed-depth search (--pruning-depth) with neither, either and both of null-move pruning and late move
+    reductions, each with a fresh transposition table"""
+    tuned = search_options(options)
+    variants = {
+        "none": dict(tuned, null_move_reduction=0, late_move_reduction=0),
+        "null_move": dict(tuned, late_move_reduction=0),
+        "late_move_reductions": dict(tuned, null_move_reduction=0),
+        "both": tuned,
+    }
+    results = {}
+    for name, game in positions(corpus):
+        if game.get_game_state() != "UNFINISHED":
+            continue
+        results[name] = {}
+        for variant, variant_options in variants.items():
+            result = Search(game._board, TranspositionTable(16), **variant_options).run(
+                game._turn, None, options.pruning_depth)
+            results[name][variant] = {"move": "%s-%s" % tuple(map(space_name, result["move"])),
+                                      "score": result["score"], "nodes": result["nodes"],
+                                      "null_move_cutoffs": result["null_move_cutoffs"],
+                                      "reduced_moves": result["reduced_moves"], "re_searches": result["re_searches"],
+                                      "ms": round(result["seconds"] * 1000, 2)}
+    return results
+
+
+def bench_parallel(corpus, options):
+    """Time to --parallel-depth for one process and for --workers processes sharing a transposition table (see
+    ParallelSearch), with the speedup and the efficiency (speedup per worker) that buys. Past os.cpu_count() workers
+    only share the cores, so expect no speedup there."""
+    tuned = search_options(options)
+    results = {"cpus": os.cpu_count()}
+    with ParallelSearch(options.workers) as parallel:
+        for name, game in positions(corpus):
+            if game.get_game_state() != "UNFINISHED":
+                continue
+            single = Search(game._board, TranspositionTable(16), **tuned).run(game._turn, None,
+                                                                               options.parallel_depth)
+            parallel.table.clear()
+            shared = parallel.run(game._board, game._turn, None, options.parallel_depth, **tuned)
+            speedup = single["seconds"] / shared["seconds"] if shared["seconds"] else None
+            results[name] = {
+                "single": {"nodes": single["nodes"], "ms": round(single["seconds"] * 1000, 2)},
+                "parallel": {"workers": shared["workers"], "worker_depths": shared["worker_depths"],
+                             "nodes": shared["nodes"], "ms": round(shared["seconds"] * 1000, 2)},
+                "speedup": round(speedup, 3) if speedup else None,
+                "efficiency": round(speedup / options.workers, 3) if speedup else None,
+            }
+    return results
+
+
+def bench_stages(corpus, options):
+    """Where the time of make_move goes: the instrumentation counters over one replay of every game record. The
+    wrappers add their own overhead, so compare these with each other rather than with the other timings."""
+    reset_stats()
+    enable_stats()
+    try:
+        for game in corpus["games"].values():
+            play(game["moves"])
+    finally:
+        disable_stats()
+    stages = get_stats()
+    reset_stats()
+    return {name: {"calls": stage["calls"], "total_us": round(stage["seconds"] * 1e6, 2),
+                   "us_per_call": round(stage["seconds"] * 1e6 / stage["calls"], 2)}
+            for name, stage in sorted(stages.items(), key=lambda item: -item[1]["seconds"])}
+
+
+BENCHMARKS = {
+    "construction": bench_construction,
+    "make_move": bench_make_move,
+    "replay": bench_replay,
+    "records": bench_records,
+    "pieces": bench_pieces,
+    "is_in_check": bench_is_in_check,
+    "checkmate": bench_checkmate,
+    "perft": bench_perft,
+    "search": bench_search,
+    "ordering": bench_ordering,
+    "pruning": bench_pruning,
+    "parallel": bench_parallel,
+    "stages": bench_stages,
+}
+
+
+def run(options):
+    """Runs the selected benchmarks
+    Args:
+        options: argparse.Namespace
+    Returns: dict"""
+    corpus = load_corpus(options.corpus)
+    results = {}
+    for name in options.only or BENCHMARKS:
+        results[name] = BENCHMARKS[name](corpus, options)
+    return {
+        "corpus_version": corpus["version"],
+        "self_play_games": [name for name, game in corpus["games"].items() if game["source"] == "self-play"],
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": options.repeat,
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the JanggiGame rules engine and print the results as JSON.")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="position corpus (default: bench_corpus.json)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (default: 5)")
+    parser.add_argument("--perft-depth", type=int, default=3, help="deepest perft (default: 3)")
+    parser.add_argument("--search-depth", type=int, default=3, help="depth of the search benchmark (default: 3)")
+    parser.add_argument("--pruning-depth", type=int, default=5, help="depth of the pruning benchmark (default: 5)")
+    parser.add_argument("--parallel-depth", type=int, default=5, help="depth of the parallel benchmark (default: 5)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="processes in the parallel benchmark (default: one per CPU)")
+    parser.add_argument("--null-move-reduction", type=int, default=2, help="0 turns null-move pruning off")
+    parser.add_argument("--late-move-reduction", type=int, default=1, help="0 turns late move reductions off")
+    parser.add_argument("--late-move-index", type=int, default=3, help="first move (from 0) that may be reduced")
+    parser.add_argument("--quick", action="store_true",
+                        help="one run and shallow perft and searches, for a smoke test")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    options = parser.parse_args(argv)
+    if options.quick:
+        options.repeat = 1
+        options.perft_depth = min(options.perft_depth, 2)
+        options.search_depth = min(options.search_depth, 2)
+        options.pruning_depth = min(options.pruning_depth, 3)
+        options.parallel_depth = min(options.parallel_depth, 3)
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    report = json.dumps(run(options), indent=2)
+    if options.output:
+        with open(options.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
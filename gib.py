@@ -0,0 +1,206 @@
+# Streaming import of Korean Janggi game records (.gib).
+#
+# A .gib file holds one or more games, each a block of [tag "value"] lines followed by numbered moves:
+#
+#     [초차림 "마상마상"]
+#     [한차림 "상마상마"]
+#     [대국결과 "한 기권승"]
+#
+#     1. 79졸78 2. 32병33 3. 한수쉼 ...
+#
+# A move is the space a piece leaves, its name and the space it lands on. A space is two digits, the row (1 to 9, 0
+# for 10) counted from Han's side and the column (1 to 9) from the left, so "79" is i7 and "02" is b10 in make_move's
+# names: Cho is blue and Han is red. 한수쉼 is a pass. The 차림 tags give each side's horses (마) and elephants (상) on
+# columns 2, 3, 7 and 8 as that player sees them, from their own left; the starting position is built as a FEN.
+#
+#     python gib.py RECORDS.gib ... [--output ARCHIVE.jsonl | --output RECORDS.jgr]
+#
+# Files are read a line at a time, as UTF-8 or else CP949, and games come out one at a time in the form
+# validate.read_archive yields, so validate.validate_games and records.pack take them as they are.
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import records
+from JanggiGame import START_FEN, SpaceError
+
+_TAG = re.compile(r'^\s*\[\s*(\S+)\s+"(.*)"\s*\]\s*$')
+_MOVE = re.compile(r"\d+\s*\.\s*(?:(\d)(\d)\s*[^\d\s.]+\s*(\d)(\d)|(한수\s*쉼))")
+_PIECES = {"마": "n", "상": "b"}
+_COLUMNS = "abcdefghi"
+
+
+def gib_space(row: str, col: str):
+    """Converts a .gib space, a row digit (0 for 10) and a column digit, to its algebraic name. Raises SpaceError
+    if it isn't a space
+    Args:
+        row: str
+        col: str
+    Returns: str"""
+    if not ("0" <= row <= "9" and "1" <= col <= "9"):
+        raise SpaceError(f"{row}{col} is not a .gib space")
+    return _COLUMNS[int(col) - 1] + str(int(row) or 10)
+
+
+def arrangement_fen(cho: str = None, han: str = None):
+    """Returns the starting FEN for the 차림 of each side (four of 마 and 상, from that player's left; None keeps the
+    side as in START_FEN). Raises ValueError for anything else
+    Args:
+        cho: str | None
+        han: str | None
+    Returns: str"""
+    ranks = START_FEN.split(" ", 1)[0].split("/")
+    sides = ((han, 0, True), (cho, len(ranks) - 1, False))
+    for arrangement, rank, from_right in sides:
+        if arrangement is None:
+            continue
+        arrangement = arrangement.replace(" ", "")
+        if len(arrangement) != 4 or any(piece not in _PIECES for piece in arrangement):
+            raise ValueError(f"{arrangement!r} is not a 차림")
+        letters = [_PIECES[piece] for piece in arrangement]
+        # Han faces Cho, so its left is the board's right
+        if from_right:
+            letters.reverse()
+        else:
+            letters = [letter.upper() for letter in letters]
+        back_rank = list(ranks[rank])
+        # the "1" of the empty e file keeps string positions equal to columns
+        back_rank[1], back_rank[2], back_rank[6], back_rank[7] = letters
+        ranks[rank] = "".join(back_rank)
+    return "/".join(ranks) + START_FEN[START_FEN.index(" "):]
+
+
+def game_result(text: str):
+    """Reads a 대국결과 tag ("초 완승", "한 시간승", ...) into the game state it declares, or None
+    Args:
+        text: str
+    Returns: str | None"""
+    text = text.replace(" ", "")
+    if "승" not in text:
+        return None
+    if text.startswith("초"):
+        return "BLUE_WON"
+    if text.startswith("한"):
+        return "RED_WON"
+    return None
+
+
+def _decode(line: bytes):
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return line.decode("cp949", "replace")
+
+
+def _game(path: str, number: int, tags: dict, moves: list):
+    """Builds the game dict for read_gib"""
+    game = {"id": f"{os.path.basename(path)}#{number}", "moves": moves, "tags": tags}
+    try:
+        fen = arrangement_fen(tags.get("초차림"), tags.get("한차림"))
+    except ValueError as error:
+        game["error"] = str(error)
+        return game
+    if fen != START_FEN:
+        game["fen"] = fen
+    result = game_result(tags.get("대국결과", ""))
+    if result is not None:
+        game["result"] = result
+    return game
+
+
+def read_gib(path: str):
+    """Yields the games of a .gib file one at a time, as dicts with "id" (the file name and the game's number from
+    0), "moves" as (current_space, new_space) pairs, "tags", and "fen" and "result" when the 차림 aren't the usual
+    ones or a result is given, or "error" when the 차림 can't be read. A game ends at the next tag line after its
+    moves, after a blank line that closes its tags, or that repeats one of its tags, so a game with no moves still
+    comes out, with its tags. A pass comes out as the general's space twice, as legal_moves writes it; a move naming
+    a space that doesn't exist keeps its digits, so replaying it stops there.
+    Args:
+        path: str
+    Returns: generator"""
+    number = 0
+    tags = {}
+    moves = []
+    # a blank line after tags ends the tag block, so another tag starts a new game even if this one has no moves
+    tags_ended = False
+    # where each general is, to write passes; the generals aren't part of the 차림
+    generals = ["e9", "e2"]
+    with open(path, "rb") as gib_file:
+        for line in gib_file:
+            line = _decode(line)
+            tag = _TAG.match(line)
+            if tag:
+                if moves or tags_ended or tag.group(1) in tags:
+                    yield _game(path, number, tags, moves)
+                    number += 1
+                    tags = {}
+                    moves = []
+                    tags_ended = False
+                    generals = ["e9", "e2"]
+                tags[tag.group(1)] = tag.group(2)
+                continue
+            if not line.strip():
+                tags_ended = bool(tags)
+                continue
+            for move in _MOVE.finditer(line):
+                # Cho (blue) moves first
+                side = len(moves) & 1
+                if move.group(5):
+                    moves.append((generals[side], generals[side]))
+                    continue
+                from_row, from_col, to_row, to_col = move.group(1, 2, 3, 4)
+                try:
+                    current_space, new_space = gib_space(from_row, from_col), gib_space(to_row, to_col)
+                except SpaceError:
+                    current_space, new_space = from_row + from_col, to_row + to_col
+                if current_space == generals[side]:
+                    generals[side] = new_space
+                moves.append((current_space, new_space))
+    if moves or tags:
+        yield _game(path, number, tags, moves)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import .gib game records as a JSON Lines archive or record file.")
+    parser.add_argument("gib", nargs="+", help=".gib files")
+    parser.add_argument("--output", help="archive to write, a record file if it ends in .jgr (default: JSON Lines "
+                                         "on stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    games = (game for path in options.gib for game in read_gib(path))
+    skipped = 0
+    if options.output and options.output.endswith(".jgr"):
+        count = 0
+        with records.RecordWriter(options.output) as writer:
+            for game in games:
+                # a record can't hold a game without its starting position, with a move off the board or too long
+                if "error" in game:
+                    skipped += 1
+                    continue
+                try:
+                    writer.write(game["moves"], game.get("result"), game.get("fen"))
+                except (SpaceError, ValueError):
+                    skipped += 1
+                    continue
+                count += 1
+    else:
+        archive = open(options.output, "w") if options.output else sys.stdout
+        count = 0
+        try:
+            for game in games:
+                archive.write(json.dumps(game, ensure_ascii=False) + "\n")
+                count += 1
+        finally:
+            if options.output:
+                archive.close()
+    print(f"{count} games" + (f", {skipped} skipped" if skipped else ""), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# Compact binary game records.
+#
+# A record file holds many games at two bytes a move, with an index so any game, or any ply of a game, is read
+# straight from a memory map without touching the rest of the file:
+#
+#     python records.py pack ARCHIVE.jsonl RECORDS.jgr
+#     python records.py unpack RECORDS.jgr ARCHIVE.jsonl
+#
+# Layout, all little-endian:
+#
+#     file header   magic b"JGR1", game count (u32), offset of the index (u64)
+#     games         per game: result (u8, see RESULTS), flags (u8), plies (u16), and if FLAG_FEN is set the length
+#                   of the starting FEN (u16) and the FEN itself, padded to an even length; then one u16 per ply
+#     index         one u64 per game, the offset of its header
+#
+# A move is encode_move(current_space, new_space) of the space indexes, which needs 13 bits. PASS_CODE stands for a
+# pass; it is turned back into the general's space twice, as make_move and legal_moves write passes. Archives in the
+# string form are the JSON Lines files validate.py reads.
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from JanggiGame import encode_move, parse_fen, parse_move, space_index, space_name, General, OFF_BOARD, START_FEN
+
+MAGIC = b"JGR1"
+FILE_HEADER = struct.Struct("<4sIQ")
+GAME_HEADER = struct.Struct("<BBH")
+FEN_LENGTH = struct.Struct("<H")
+MOVE = struct.Struct("<H")
+OFFSET = struct.Struct("<Q")
+PASS_CODE = 0xFFFF
+# the game has a starting FEN after its header
+FLAG_FEN = 1
+# the result byte: get_game_state values, and None for a game stored without one
+RESULTS = ("UNFINISHED", "BLUE_WON", "RED_WON", None)
+_RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+MAX_PLIES = 0xFFFF
+MAX_FEN_LENGTH = 0xFFFF
+
+
+def encode_record_move(current_space: str, new_space: str):
+    """Returns the two-byte code of a move given as algebraic spaces, PASS_CODE for a pass. Raises SpaceError for
+    an invalid space
+    Args:
+        current_space: str
+        new_space: str
+    Returns: int"""
+    if current_space == new_space:
+        return PASS_CODE
+    return encode_move(space_index(current_space), space_index(new_space))
+
+
+def decode_record_move(code: int):
+    """Returns the (current_space, new_space) indexes of a move code, or None for PASS_CODE
+    Args:
+        code: int
+    Returns: (int, int) | None"""
+    if code == PASS_CODE:
+        return None
+    return divmod(code, OFF_BOARD)
+
+
+def _generals(fen: str):
+    """Returns the space of each color's general at the start of a game"""
+    if fen is None:
+        return {"blue": space_index("e9"), "red": space_index("e2")}
+    return {color: space for kind, color, space in parse_fen(fen)[0] if kind is General}
+
+
+def _first_turn(fen: str):
+    return "blue" if fen is None else parse_fen(fen)[1]
+
+
+# the name pair of every move code
+_MOVE_NAMES = [(space_name(current_space), space_name(new_space))
+               for current_space in range(OFF_BOARD) for new_space in range(OFF_BOARD)]
+
+
+def decode_moves(codes, fen: str = None):
+    """Turns the move codes of a game back into the (current_space, new_space) pairs make_move takes. Passes come
+    back as the general's space twice, so the generals are followed from the starting position.
+    Args:
+        codes: iterable of int
+        fen: str | None
+    Returns: list of (str, str)"""
+    names = _MOVE_NAMES
+    moves = [names[code] if code != PASS_CODE else None for code in codes]
+    if None in moves:
+        generals = _generals(fen)
+        turn = _first_turn(fen)
+        other = "red" if turn == "blue" else "blue"
+        for ply, code in enumerate(codes):
+            if code == PASS_CODE:
+                name = space_name(generals[turn])
+                moves[ply] = (name, name)
+            elif code // OFF_BOARD == generals[turn]:
+                generals[turn] = code % OFF_BOARD
+            turn, other = other, turn
+    return moves
+
+
+def _as_pair(move):
+    if isinstance(move, str):
+        return parse_move(move)
+    return move
+
+
+class RecordWriter:
+    """Writes games to a record file one at a time, so an archive of any size streams through. The index and the
+    game count are written by close (or the end of a with block)."""
+
+    def __init__(self, path: str):
+        """Args:
+            path: str
+        """
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, 0, 0))
+        self._offsets = array("Q")
+
+    def write(self, moves, result: str = None, fen: str = None):
+        """Adds a game. Raises ValueError for a game longer than MAX_PLIES, a FEN that isn't ASCII or is longer than
+        MAX_FEN_LENGTH bytes or an unknown result, and SpaceError for an invalid move; a game refused either way
+        leaves nothing in the file.
+        Args:
+            moves: iterable of (current_space, new_space) or of strings parse_move reads
+            result: str | None
+                the game's get_game_state value, if known
+            fen: str | None
+                the starting position, None for the usual setup
+        Returns: None"""
+        codes = array("H", (encode_record_move(*pair) for pair in map(_as_pair, moves) if pair is not None))
+        if len(codes) > MAX_PLIES:
+            raise ValueError(f"a game of {len(codes)} plies is too long for a record")
+        if result not in _RESULT_CODES:
+            raise ValueError(f"{result!r} is not a game state")
+        if fen == START_FEN:
+            fen = None
+        # checked before anything is written, so a game refused here leaves the file as it was
+        fen_bytes = b""
+        if fen:
+            try:
+                fen_bytes = fen.encode("ascii")
+            except (AttributeError, UnicodeEncodeError):
+                raise ValueError(f"{fen!r} is not an ASCII FEN") from None
+            if len(fen_bytes) > MAX_FEN_LENGTH:
+                raise ValueError(f"a FEN of {len(fen_bytes)} bytes is too long for a record")
+        if sys.byteorder == "big":
+            codes.byteswap()
+        self._offsets.append(self._file.tell())
+        self._file.write(GAME_HEADER.pack(_RESULT_CODES[result], FLAG_FEN if fen else 0, len(codes)))
+        if fen:
+            self._file.write(FEN_LENGTH.pack(len(fen_bytes)) + fen_bytes + b"\0" * (len(fen_bytes) & 1))
+        self._file.write(codes.tobytes())
+
+    def close(self):
+        """Writes the index and the file header and closes the file"""
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        offsets = array("Q", self._offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self._file.write(offsets.tobytes())
+        self._file.seek(0)
+        self._file.write(FILE_HEADER.pack(MAGIC, len(self._offsets), index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordReader:
+    """Memory-maps a record file. Games are numbered from 0; len gives how many there are, and indexing or iterating
+    gives them as dicts with "moves" (in the string form), "result" and "fen". plies, result, fen, codes and move
+    read only what they need of one game."""
+
+    def __init__(self, path: str):
+        """Raises ValueError if the file isn't a record file
+        Args:
+            path: str
+        """
+        with open(path, "rb") as record_file:
+            self._map = mmap.mmap(record_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < FILE_HEADER.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a game record file")
+        magic, self._count, self._index = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a game record file")
+
+    def __len__(self):
+        return self._count
+
+    def _header(self, game: int):
+        """Returns the result code, starting FEN, plies and offset of the first move of a game"""
+        if not 0 <= game < self._count:
+            raise IndexError(f"there is no game {game}")
+        offset = OFFSET.unpack_from(self._map, self._index + game * OFFSET.size)[0]
+        result, flags, plies = GAME_HEADER.unpack_from(self._map, offset)
+        offset += GAME_HEADER.size
+        fen = None
+        if flags & FLAG_FEN:
+            length = FEN_LENGTH.unpack_from(self._map, offset)[0]
+            offset += FEN_LENGTH.size
+            fen = self._map[offset:offset + length].decode("ascii")
+            offset += length + (length & 1)
+        return result, fen, plies, offset
+
+    def plies(self, game: int):
+        """Returns: int"""
+        return self._header(game)[2]
+
+    def result(self, game: int):
+        """Returns the game's get_game_state value, or None if it was stored without one
+        Returns: str | None"""
+        return RESULTS[self._header(game)[0]]
+
+    def fen(self, game: int):
+        """Returns the starting FEN, or None for the usual setup
+        Returns: str | None"""
+        return self._header(game)[1]
+
+    def codes(self, game: int):
+        """Returns the move codes of a game (see encode_record_move)
+        Returns: array"""
+        _, _, plies, offset = self._header(game)
+        codes = array("H", self._map[offset:offset + plies * MOVE.size])
+        if sys.byteorder == "big":
+            codes.byteswap()
+        return codes
+
+    def move(self, game: int, ply: int):
+        """Returns a game's move at a ply (from 0) as a (current_space, new_space) pair. Only a pass needs the plies
+        before it, to know where the general is.
+        Returns: (str, str)"""
+        _, fen, plies, offset = self._header(game)
+        if not 0 <= ply < plies:
+            raise IndexError(f"game {game} has no ply {ply}")
+        code = MOVE.unpack_from(self._map, offset + ply * MOVE.size)[0]
+        if code != PASS_CODE:
+            return _MOVE_NAMES[code]
+        codes = array("H", self._map[offset:offset + (ply + 1) * MOVE.size])
+        if sys.byteorder == "big":
+            codes.byteswap()
+        return decode_moves(codes, fen)[ply]
+
+    def __getitem__(self, game: int):
+        result, fen, plies, offset = self._header(game)
+        codes = array("H", self._map[offset:offset + plies * MOVE.size])
+        if sys.byteorder == "big":
+            codes.byteswap()
+        return {"moves": decode_moves(codes, fen), "result": RESULTS[result], "fen": fen}
+
+    def __iter__(self):
+        for game in range(self._count):
+            yield self[game]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def is_record_file(path: str):
+    """Returns True if the file starts with the record file magic
+    Args:
+        path: str
+    Returns: True | False"""
+    with open(path, "rb") as record_file:
+        return record_file.read(len(MAGIC)) == MAGIC
+
+
+def pack(games, path: str):
+    """Writes games (dicts with "moves" and optionally "result" and "fen", as validate.read_archive yields them) to a
+    record file
+    Args:
+        games: iterable of dict
+        path: str
+    Returns: int, the number of games written"""
+    count = 0
+    with RecordWriter(path) as writer:
+        for game in games:
+            writer.write(game["moves"], game.get("result"), game.get("fen"))
+            count += 1
+    return count
+
+
+def unpack(path: str):
+    """Yields the games of a record file in the string form, like validate.read_archive
+    Args:
+        path: str
+    Returns: generator"""
+    with RecordReader(path) as reader:
+        for game in reader:
+            yield {key: value for key, value in game.items() if value is not None}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert game archives to and from the binary record format.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_command = commands.add_parser("pack", help="JSON Lines archive to record file")
+    pack_command.add_argument("archive")
+    pack_command.add_argument("records")
+    unpack_command = commands.add_parser("unpack", help="record file to JSON Lines archive")
+    unpack_command.add_argument("records")
+    unpack_command.add_argument("archive")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # imported here, validate reads record files with this module
+    from validate import read_archive
+    options = parse_args(argv)
+    if options.command == "pack":
+        count = pack(read_archive(options.archive), options.records)
+    else:
+        count = 0
+        with open(options.archive, "w") as archive:
+            for game in unpack(options.records):
+                archive.write(json.dumps(game) + "\n")
+                count += 1
+    print(f"{count} games", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
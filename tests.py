@@ -1,5 +1,13 @@
 import unittest
-from JanggiGame import JanggiGame, print_board
+import contextlib
+import io
+import itertools
+import os
+import shutil
+from JanggiGame import (JanggiGame, Board, EventSink, ConsoleSink, Search, TranspositionTable, space_index, encode_move,
+                        PASS_MOVE, MATE_SCORE, EXACT, LOWER, UPPER, enable_stats, disable_stats,
+                        reset_stats, get_stats, EVAL_TABLES, PIECE_POINTS, Soldier, table_words, START_FEN, FenError,
+                        GAME_OVER, ILLEGAL_MOVE, NOT_A_MOVE, format_board, print_board)
 
 class TestJanggiGame(unittest.TestCase):
     def setUp(self):
@@ -15,6 +23,13 @@ class TestJanggiGame(unittest.TestCase):
         g = JanggiGame()
         self.assertIsInstance(g, JanggiGame)
 
+    def test_that_a_move_to_an_invalid_space_is_rejected(self):
+        """a destination outside a1-i10 is just an illegal move"""
+        g = JanggiGame()
+        self.assertIs(g.make_move('a10', 'a11'), False)
+        self.assertIs(g.make_move('a7', 'j7'), False)
+        self.assertIs(g.make_move('a7', 'a6'), True)
+
 #    @visibility('visible')
     def test_that_blue_can_start_the_game(self):
         """RULES: Blue can start the game"""
@@ -676,6 +691,16 @@ class TestJanggiGame(unittest.TestCase):
         except:
             self.fail("Red Guard should not be able to move outside the palace")
 
+    def test_guard_only_moves_diagonally_along_the_fortress_lines(self):
+        """a guard on the middle of a fortress edge has no diagonal moves"""
+        g = JanggiGame()
+        self.assertIs(g.make_move('d10', 'd9'), True)
+        g.make_move('a4', 'a4')
+        self.assertIs(g.make_move('d9', 'e8'), False)
+        self.assertIs(g.make_move('d9', 'd8'), True)
+        g.make_move('a4', 'a4')
+        self.assertIs(g.make_move('d8', 'e8'), True)
+
 #    @visibility('visible')
     def test_valid_move_for_elephant(self):
         """ELEPHANT: test elephants can make valid moves"""
@@ -1698,6 +1723,654 @@ class TestJanggiGame(unittest.TestCase):
         except:
             self.fail("Game state should be RED_WON when the BLUE general is checkmated")
 
+
+    def test_position_key(self):
+        """the position key depends on the pieces and the side to move, not on how the position was reached"""
+        g1, g2 = JanggiGame(), JanggiGame()
+        start = g1.position_key()
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('a7', 'a6'), ('g4', 'f4')]:
+            g1.make_move(*move)
+        for move in [('a7', 'a6'), ('g4', 'f4'), ('c7', 'c6'), ('c1', 'd3')]:
+            g2.make_move(*move)
+        self.assertEqual(g1.position_key(), g2.position_key())
+        self.assertNotEqual(g1.position_key(), start)
+        before_pass = g1.position_key()
+        g1.make_move('e9', 'e9')
+        self.assertNotEqual(g1.position_key(), before_pass)
+        g1.make_move('e2', 'e2')
+        self.assertEqual(g1.position_key(), before_pass)
+        self.assertIs(g1.make_move('e7', 'e6'), True)
+        self.assertIs(g1.make_move('e6', 'e6'), True)
+        self.assertNotEqual(g1.position_key(), before_pass)
+
+    def test_fen(self):
+        """to_fen and from_fen round-trip positions, counters and the side to move, and bad strings are refused"""
+        g = JanggiGame()
+        self.assertEqual(g.to_fen(), START_FEN)
+        self.assertEqual(JanggiGame.from_fen(START_FEN).position_key(), g.position_key())
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6'), ('e3', 'e6'),
+                     ('e9', 'e9')]:
+            g.make_move(*move)
+        self.assertEqual(g.to_fen(), 'rb1a1abnr/4k4/3n3c1/p1p1p1p1p/9/2P1c4/P2B2P1P/1C5C1/4K4/R1NA1ABNR b - - 1 4')
+        loaded = JanggiGame.from_fen(g.to_fen())
+        self.assertEqual(loaded.to_fen(), g.to_fen())
+        self.assertEqual(loaded.position_key(), g.position_key())
+        self.assertEqual(loaded.perft(2), g.perft(2))
+        self.assertEqual(sorted(loaded.legal_moves()), sorted(g.legal_moves()))
+        self.assertIs(loaded.make_move('a4', 'a5'), True)
+        self.assertIs(loaded.make_move('a4', 'a5'), False)
+        mated = JanggiGame.from_fen('1b3R3/9/5k3/2n6/1B7/9/4P1b2/3NA4/5K3/7N1 b - - 0 55')
+        self.assertEqual(mated.get_game_state(), 'BLUE_WON')
+        self.assertIs(mated.make_move('f3', 'f2'), False)
+        for fen in ['', 'rbna1abnr/4k4 w', START_FEN.replace('4k4', '1k7', 1), START_FEN.replace('4k4', '9', 1),
+                    START_FEN.replace('4k4', '4k5', 1), START_FEN.replace('4k4', '4x4', 1),
+                    START_FEN.replace(' w ', ' r '), START_FEN.replace('4K4', '4K3', 1),
+                    START_FEN.replace(' 0 1', ' 0 one'), '4k4/9/9/9/4R4/9/9/9/3K5/9 w']:
+            with self.assertRaises(FenError):
+                JanggiGame.from_fen(fen)
+
+    def test_replay(self):
+        """replay plays a record to its result, stops at the first refused move and streams lines or plies lazily"""
+        import benchmarks
+        moves = benchmarks.load_corpus()["games"]["red-won"]["moves"]
+        g = JanggiGame()
+        self.assertEqual(g.replay(iter(moves)), {"game_state": "RED_WON", "plies": len(moves), "illegal_ply": None,
+                                                 "illegal_move": None, "reason": None})
+        self.assertEqual(g.replay([("a1", "a2")])["reason"], GAME_OVER)
+        result = JanggiGame().replay(moves[:4] + [("c10", "b8")] + moves[4:])
+        self.assertEqual((result["plies"], result["illegal_ply"], result["illegal_move"], result["reason"]),
+                         (4, 4, ("c10", "b8"), ILLEGAL_MOVE))
+        record = io.StringIO("c7 c6\nc1-d3\n\nb10d7\ne2e2\nz9 a1\ne7e6\n")
+        result = JanggiGame().replay(record)
+        self.assertEqual((result["plies"], result["illegal_ply"], result["reason"]), (4, 4, NOT_A_MOVE))
+        self.assertEqual(record.readline(), "e7e6\n")
+        for bad_move in [None, 7, ("c7",), ("c7", "c6", "c5"), ("c7", 6), {"c7": "c6", "c1": "d3"}]:
+            result = JanggiGame().replay([("c7", "c6"), bad_move, ("c1", "d3")])
+            self.assertEqual((result["plies"], result["illegal_ply"], result["illegal_move"], result["reason"]),
+                             (1, 1, bad_move, NOT_A_MOVE))
+        sink = EventSink()
+        g = JanggiGame(sink=sink)
+        plies = list(itertools.islice(g.replay_plies(itertools.cycle([("e9", "e9"), ("e2", "e2")])), 3))
+        self.assertEqual([ply["ply"] for ply in plies], [0, 1, 2])
+        self.assertTrue(all(ply["accepted"] and not ply["check"] for ply in plies))
+        self.assertIs(g._sink, sink)
+        plies = list(JanggiGame().replay_plies(moves))
+        self.assertEqual(plies[-1]["game_state"], "RED_WON")
+        g = JanggiGame()
+        for ply in plies[:-1]:
+            g.make_move(*ply["move"])
+            self.assertEqual(ply["check"], g.is_in_check(g._turn))
+
+    def test_legal_moves(self):
+        """legal_moves yields exactly the moves make_move accepts, passing included"""
+        g = JanggiGame()
+        moves = list(g.legal_moves())
+        self.assertEqual(moves[-1], ('e9', 'e9'))
+        self.assertIn(('c7', 'c6'), moves)
+        self.assertNotIn(('c10', 'b8'), moves)
+        for move in moves:
+            self.assertIs(JanggiGame().make_move(*move), True)
+
+    def test_legal_moves_in_check(self):
+        """a player in check can't pass and every legal move gets the general out of check"""
+        g = JanggiGame()
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'b3'), ('c10', 'd8'), ('h1', 'g3'),
+                     ('e7', 'e6'), ('b3', 'b3'), ('e6', 'f6'), ('b3', 'b3'), ('h8', 'c8'), ('d3', 'e5'),
+                     ('c8', 'c4'), ('e5', 'c4'), ('i10', 'i8'), ('g4', 'f4'), ('i8', 'f8'), ('g3', 'h5'),
+                     ('h10', 'g8'), ('d1', 'd2'), ('e9', 'e9'), ('d2', 'd3'), ('e9', 'e9'), ('b3', 'e3')]:
+            g.make_move(*move)
+        self.assertIs(g.is_in_check('blue'), True)
+        moves = list(g.legal_moves())
+        self.assertIn(('f8', 'e8'), moves)
+        self.assertNotIn(('f8', 'f7'), moves)
+        self.assertNotIn(('e9', 'e9'), moves)
+        self.assertIs(g.make_move('e9', 'e9'), False)
+
+    def test_perft(self):
+        """perft counts agree between bulk, full and hashed counting, and divide splits them by first move"""
+        g = JanggiGame()
+        self.assertEqual([g.perft(depth) for depth in range(4)], [1, 32, 1024, 33506])
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6')]:
+            g.make_move(*move)
+        self.assertEqual(g.perft(2, bulk=False), g.perft(2))
+        self.assertEqual(g.perft(3, hashed=True), 58180)
+        divide = g.divide(2)
+        self.assertEqual(len(divide), g.perft(1))
+        self.assertEqual(sum(divide.values()), g.perft(2))
+        g.make_move('e3', 'e6')
+        self.assertEqual(divide['e3', 'e6'], len(list(g.legal_moves())))
+
+    def test_perft_reference(self):
+        """the move generator agrees with the reference one (every piece's get_legal_moves filtered by
+        exposes_general) move by move, from the start and from positions in and out of check"""
+        for fen in [START_FEN,
+                    'rb1a1ab1r/4k4/4c2c1/p1n1pp2p/7n1/2P6/P2B2P1P/1C1N1RN2/4K4/R2A1AB2 w - - 6 10',
+                    '1bna3n1/3k1a1b1/1c7/p1p6/7p1/4P4/3P4P/1C3A3/4NK2N/1B4B1R w - - 0 21',
+                    '9/9/4k2c1/1C1b5/6p2/c1B6/9/3N1K3/9/2R6 w - - 7 71']:
+            g = JanggiGame.from_fen(fen)
+            for depth in range(1, 4):
+                self.assertEqual(g.divide(depth, reference=True), g.divide(depth), (fen, depth))
+            self.assertEqual(g.perft(2, bulk=False, reference=True), g.perft(2))
+            self.assertEqual(g.to_fen(), fen)
+        self.assertEqual(JanggiGame().perft(3, reference=True), 33506)
+
+    def test_benchmark_corpus(self):
+        """every game record in the benchmark corpus still replays to its recorded result"""
+        import benchmarks
+        corpus = benchmarks.load_corpus()
+        for game in corpus["games"].values():
+            self.assertIn(game["source"], ("hand-played", "self-play"))
+            self.assertEqual(benchmarks.play(game["moves"]).get_game_state(), game["result"])
+        for entry in corpus["positions"]:
+            self.assertLessEqual(entry["ply"], len(corpus["games"][entry["game"]]["moves"]))
+
+    def test_validate(self):
+        """the batch validator gives the same per-game results in one process and in a pool, ordered or not"""
+        import json
+        import tempfile
+        import benchmarks
+        import validate
+        games = benchmarks.load_corpus()["games"]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as archive:
+            for name, game in games.items():
+                archive.write(json.dumps({"id": name, "moves": game["moves"]}) + "\n")
+            archive.write("\n" + json.dumps(["c7 c6", "c1-d3", "c10 b8"]) + "\n")
+            archive.write(json.dumps([["c7", "c6"], 7]) + "\n")
+            archive.write(json.dumps({"fen": "9/9 w", "moves": []}) + "\n")
+        try:
+            results = list(validate.validate_games(validate.read_archive(archive.name), workers=1))
+            self.assertEqual([index for index, _ in results], list(range(len(games) + 3)))
+            self.assertEqual([result["game_state"] for _, result in results[:len(games)]],
+                             [game["result"] for game in games.values()])
+            self.assertEqual((results[-3][1]["illegal_ply"], results[-3][1]["reason"]), (2, "ILLEGAL_MOVE"))
+            self.assertEqual((results[-2][1]["illegal_ply"], results[-2][1]["illegal_move"], results[-2][1]["reason"]),
+                             (1, 7, NOT_A_MOVE))
+            self.assertIsNotNone(results[-1][1]["error"])
+            pooled = validate.validate_games(validate.read_archive(archive.name), workers=2, chunk_size=2)
+            self.assertEqual(list(pooled), results)
+            pooled = validate.validate_games(validate.read_archive(archive.name), workers=2, chunk_size=3,
+                                             ordered=False)
+            self.assertEqual(sorted(pooled, key=lambda item: item[0]), results)
+            output = io.StringIO()
+            summary = validate.validate_archive(archive.name, workers=2, chunk_size=2, output=output)
+            self.assertEqual((summary["games"], summary["valid"], summary["illegal"], summary["errors"]),
+                             (len(games) + 3, len(games), 2, 1))
+            self.assertEqual(len(output.getvalue().splitlines()), len(games) + 3)
+        finally:
+            os.remove(archive.name)
+
+    def test_validate_reports_bad_lines(self):
+        """a line that isn't JSON, a FEN that isn't a string and moves that aren't a list are errors of their own
+        game, in a pool too, and the games around them are still validated"""
+        import json
+        import tempfile
+        import validate
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as archive:
+            archive.write(json.dumps([["c7", "c6"]]) + "\n")
+            archive.write('{"moves": [["c7", "c6"]\n')
+            archive.write(json.dumps({"fen": 5, "moves": []}) + "\n")
+            archive.write(json.dumps({"moves": 5}) + "\n")
+            archive.write(json.dumps({"moves": "c7c6"}) + "\n")
+            archive.write(json.dumps(7) + "\n")
+            archive.write(json.dumps({"moves": [["c7", "c6"], ["c1", "d3"]]}) + "\n")
+        try:
+            results = [result for _, result in validate.validate_games(validate.read_archive(archive.name),
+                                                                       workers=2, chunk_size=2)]
+            self.assertEqual([result["error"] is not None for result in results],
+                             [False, True, True, True, True, True, False])
+            self.assertIn("line 2", results[1]["error"])
+            self.assertEqual([result["plies"] for result in results], [1, 0, 0, 0, 0, 0, 2])
+            summary = validate.validate_archive(archive.name, workers=1)
+            self.assertEqual((summary["games"], summary["valid"], summary["illegal"], summary["errors"]), (7, 2, 0, 5))
+        finally:
+            os.remove(archive.name)
+
+    def test_records(self):
+        """record files round-trip games, passes and starting positions, and read any ply without the rest"""
+        import tempfile
+        import benchmarks
+        import records
+        import validate
+        games = [{"moves": game["moves"], "result": game["result"]}
+                 for game in benchmarks.load_corpus()["games"].values()]
+        games.append({"moves": [("c7", "c6"), ("a1", "a1"), ("e9", "e8"), "d1 d2", ("e8", "e8"), ("e2", "e2")]})
+        fen = '1b3R3/9/5k3/2n6/1B7/9/4P1b2/3NA4/5K3/7N1 b - - 0 55'
+        games.append({"moves": [("f3", "f3")], "result": "BLUE_WON", "fen": fen})
+        with tempfile.NamedTemporaryFile(suffix=".jgr", delete=False) as record_file:
+            pass
+        try:
+            self.assertEqual(records.pack(iter(games), record_file.name), len(games))
+            self.assertIs(records.is_record_file(record_file.name), True)
+            with records.RecordReader(record_file.name) as reader:
+                self.assertEqual(len(reader), len(games))
+                for number, game in enumerate(games[:-2]):
+                    self.assertEqual(reader[number], {"moves": game["moves"], "result": game["result"], "fen": None})
+                    self.assertEqual(reader.plies(number), len(game["moves"]))
+                    self.assertEqual(reader.move(number, 7), game["moves"][7])
+                self.assertEqual(reader[len(games) - 2]["moves"],
+                                 [("c7", "c6"), ("e2", "e2"), ("e9", "e8"), ("d1", "d2"), ("e8", "e8"), ("e2", "e2")])
+                self.assertEqual(reader.move(len(games) - 2, 4), ("e8", "e8"))
+                self.assertIsNone(reader.result(len(games) - 2))
+                self.assertEqual(reader[len(games) - 1], {"moves": [("f3", "f3")], "result": "BLUE_WON", "fen": fen})
+                self.assertEqual(reader.codes(len(games) - 1).tolist(), [records.PASS_CODE])
+                with self.assertRaises(IndexError):
+                    reader.move(0, reader.plies(0))
+                with self.assertRaises(IndexError):
+                    reader[len(games)]
+            states = [result["game_state"] for _, result in
+                      validate.validate_games(validate.read_archive(record_file.name), workers=1)]
+            self.assertEqual(states[:-2], [game["result"] for game in games[:-2]])
+            self.assertEqual(states[-2], "UNFINISHED")
+        finally:
+            os.remove(record_file.name)
+
+    def test_record_writer_refuses_bad_fen(self):
+        """a FEN that isn't ASCII or doesn't fit its length field is refused before the game is started on disk"""
+        import tempfile
+        import records
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "games.jgr")
+            with records.RecordWriter(path) as writer:
+                writer.write([("c7", "c6")])
+                for fen in [START_FEN.replace("w", "é"), "9/" * 40000, 5]:
+                    with self.assertRaises(ValueError):
+                        writer.write([("c7", "c6")], fen=fen)
+                writer.write([("c1", "d3")], "UNFINISHED")
+            with records.RecordReader(path) as reader:
+                self.assertEqual(list(reader), [{"moves": [("c7", "c6")], "result": None, "fen": None},
+                                                {"moves": [("c1", "d3")], "result": "UNFINISHED", "fen": None}])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_gib(self):
+        """.gib records come in game by game with their 차림, passes and results, in UTF-8 or CP949, ready to validate"""
+        import tempfile
+        import gib
+        import records
+        import validate
+        text = ('[대회명 "연습"]\n[초차림 "마상마상"]\n[한차림 "마상마상"]\n[대국결과 "한 기권승"]\n\n'
+                '1. 02마83 2. 18마37 3. 한수쉼 4. 한수쉼\n5. 95장94\n6. 한수 쉼 7. 한수쉼\n\n'
+                '[초차림 "상마상마"]\n[한차림 "상마마상"]\n[대국결과 "초 완승"]\n'
+                '1. 73졸63 2. 13마34 3. 03마84 4. 43병53 5. 84마65 6. 11차10\n')
+        self.assertEqual(gib.arrangement_fen("상마상마", "마상마상"), START_FEN)
+        for encoding in ("utf-8", "cp949"):
+            with tempfile.NamedTemporaryFile("wb", suffix=".gib", delete=False) as gib_file:
+                gib_file.write(text.encode(encoding))
+            try:
+                games = list(gib.read_gib(gib_file.name))
+                self.assertEqual(len(games), 2)
+                self.assertEqual(games[0]["moves"], [("b10", "c8"), ("h1", "g3"), ("e9", "e9"), ("e2", "e2"),
+                                                     ("e9", "d9"), ("e2", "e2"), ("d9", "d9")])
+                self.assertEqual(games[0]["fen"].split()[0],
+                                 "rbna1abnr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RNBA1ANBR")
+                self.assertEqual(games[0]["result"], "RED_WON")
+                self.assertEqual(games[1]["fen"].split()[0],
+                                 "rbna1anbr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RBNA1ABNR")
+                self.assertEqual(games[1]["tags"]["대국결과"], "초 완승")
+                results = [result for _, result in validate.validate_games(validate.read_archive(gib_file.name),
+                                                                           workers=1)]
+                self.assertEqual([result["illegal_ply"] for result in results], [None, 5])
+                self.assertEqual((results[1]["illegal_move"], results[1]["reason"]), (["11", "10"], NOT_A_MOVE))
+            finally:
+                os.remove(gib_file.name)
+        with self.assertRaises(ValueError):
+            gib.arrangement_fen("마마마")
+        # a game with tags but no moves is a game of its own, ended by a blank line or by a tag repeating
+        blocks = ('[대국결과 "초 완승"]\n\n[대국결과 "한 완승"]\n1. 73졸63\n'
+                  '[대회명 "연습"]\n[대회명 "연습"]\n[대국결과 "한 완승"]\n')
+        with tempfile.NamedTemporaryFile("wb", suffix=".gib", delete=False) as gib_file:
+            gib_file.write(blocks.encode("utf-8"))
+        try:
+            split_games = list(gib.read_gib(gib_file.name))
+        finally:
+            os.remove(gib_file.name)
+        self.assertEqual([(game.get("result"), game["moves"]) for game in split_games],
+                         [("BLUE_WON", []), ("RED_WON", [("c7", "c6")]), (None, []), ("RED_WON", [])])
+        self.assertEqual([game["id"].split("#")[1] for game in split_games], ["0", "1", "2", "3"])
+        # the game with a move off the board is left out of a record file, the games around it aren't
+        directory = tempfile.mkdtemp()
+        try:
+            gib_path = os.path.join(directory, "games.gib")
+            with open(gib_path, "w", encoding="utf-8") as gib_file:
+                gib_file.write(text + '[대국결과 "초 완승"]\n1. 73졸63\n')
+            jgr_path = os.path.join(directory, "games.jgr")
+            with contextlib.redirect_stderr(io.StringIO()) as messages:
+                gib.main([gib_path, "--output", jgr_path])
+            self.assertEqual(messages.getvalue(), "2 games, 1 skipped\n")
+            with records.RecordReader(jgr_path) as reader:
+                self.assertEqual([reader[game]["moves"] for game in range(len(reader))],
+                                 [games[0]["moves"], [("c7", "c6")]])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_best_move(self):
+        """the search finds a mate in one, leaves the position as it was and keeps to its time budget"""
+        g = JanggiGame()
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('c10', 'd8'), ('h1', 'g3'),
+                     ('e7', 'e6'), ('e3', 'e6'), ('h8', 'c8'), ('d3', 'e5'), ('c8', 'c4'), ('e5', 'c4'),
+                     ('i10', 'i8'), ('g4', 'f4'), ('i8', 'f8'), ('g3', 'h5'), ('h10', 'g8'), ('e6', 'e3'),
+                     ('e9', 'd9'), ('c4', 'e5'), ('c6', 'd6'), ('e5', 'c4'), ('a7', 'a6'), ('h3', 'h9'),
+                     ('a10', 'a7'), ('c4', 'd6'), ('a6', 'b6'), ('h5', 'g7'), ('b8', 'b1'), ('a1', 'b1'),
+                     ('a7', 'a4'), ('b1', 'c1'), ('a4', 'a2'), ('e2', 'e1'), ('i7', 'h7')]:
+            g.make_move(*move)
+        key = g.position_key()
+        result = g.best_move(max_depth=3)
+        self.assertEqual(result['score'], MATE_SCORE - 1)
+        self.assertEqual(result['pv'], [result['move']])
+        self.assertEqual(g.position_key(), key)
+        self.assertIs(g.make_move(*result['move']), True)
+        self.assertEqual(g.get_game_state(), 'RED_WON')
+        self.assertIsNone(g.best_move())
+        g = JanggiGame()
+        key = g.position_key()
+        result = g.best_move(time_limit_ms=50)
+        self.assertGreaterEqual(result['depth'], 1)
+        self.assertLess(result['seconds'], 1)
+        self.assertIn(result['move'], list(g.legal_moves()))
+        self.assertEqual(g.position_key(), key)
+        # short limits are kept in a middlegame too, only the first root move may run over
+        g = JanggiGame.from_fen('rb1a1abnr/4k4/3n3c1/p1p1p1p1p/9/2P1c4/P2B2P1P/1C5C1/4K4/R1NA1ABNR b - - 1 4')
+        for limit in (1, 30):
+            result = g.best_move(time_limit_ms=limit)
+            self.assertLess(result['seconds'], 0.15)
+            self.assertIn(result['move'], list(g.legal_moves()))
+
+    def test_parallel_search(self):
+        """two processes sharing a table return a legal move, fill the shared table and leave the position alone"""
+        g = JanggiGame()
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('c10', 'd8'), ('h1', 'g3'),
+                     ('e7', 'e6'), ('e3', 'e6'), ('h8', 'c8'), ('d3', 'e5'), ('c8', 'c4'), ('e5', 'c4'),
+                     ('i10', 'i8'), ('g4', 'f4'), ('i8', 'f8'), ('g3', 'h5'), ('h10', 'g8'), ('e6', 'e3'),
+                     ('e9', 'd9'), ('c4', 'e5'), ('c6', 'd6'), ('e5', 'c4'), ('a7', 'a6'), ('h5', 'g7')]:
+            g.make_move(*move)
+        key = g.position_key()
+        try:
+            result = g.best_move(time_limit_ms=None, max_depth=3, hash_mb=1, workers=2)
+            self.assertEqual(result['workers'], 2)
+            self.assertEqual(len(result['worker_depths']), 2)
+            self.assertIn(result['move'], list(g.legal_moves()))
+            self.assertEqual(g.position_key(), key)
+            self.assertGreater(g._parallel.table.usage(), 0)
+        finally:
+            g.close_search()
+        self.assertIsNone(g._parallel)
+        # a search nobody closes still frees its pool and shared block once it is dropped
+        import gc
+        from multiprocessing import shared_memory
+        g.best_move(time_limit_ms=None, max_depth=1, hash_mb=1, workers=2)
+        name = g._parallel._memory.name
+        finalizer = g._parallel._finalizer
+        del g
+        gc.collect()
+        self.assertFalse(finalizer.alive)
+        self.assertRaises(FileNotFoundError, shared_memory.SharedMemory, name=name)
+        table = TranspositionTable(1, memoryview(bytearray(table_words(1) * 8)).cast("Q"), generation=5)
+        table.store(key, encode_move(0, 9), 4, EXACT, 12)
+        self.assertEqual(table.probe(key), (encode_move(0, 9), 4, EXACT, 12))
+        table.clear()
+        self.assertIsNone(table.probe(key))
+        table.release()
+
+    def test_transposition_table(self):
+        """entries come back as stored, a shallower result only takes the always-replace slot, and the size is fixed"""
+        table = TranspositionTable(1)
+        self.assertEqual(len(table), (1 << 20) // 16)
+        key = 0x123456789ABCDEF0
+        collision = key ^ (1 << 40)
+        self.assertIsNone(table.probe(key))
+        table.store(key, encode_move(space_index('c7'), space_index('c6')), 5, EXACT, -MATE_SCORE + 3)
+        self.assertEqual(table.probe(key), (encode_move(space_index('c7'), space_index('c6')), 5, EXACT,
+                                            -MATE_SCORE + 3))
+        table.store(collision, 0, 2, LOWER, 700)
+        self.assertEqual(table.probe(key)[1], 5)
+        self.assertEqual(table.probe(collision), (0, 2, LOWER, 700))
+        table.store(collision ^ (1 << 41), 0, 1, UPPER, -200)
+        self.assertIsNone(table.probe(collision))
+        self.assertIsNotNone(table.probe(key))
+        table.new_search()
+        table.store(collision, 0, 1, UPPER, -200)
+        self.assertIsNone(table.probe(key))
+        table.clear()
+        self.assertIsNone(table.probe(collision))
+        g = JanggiGame()
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6')]:
+            g.make_move(*move)
+        self.assertEqual(g.best_move(None, 3, hash_mb=None)['score'], g.best_move(None, 3, hash_mb=1)['score'])
+
+    def test_move_ordering(self):
+        """captures come first, most valuable victim first, and ordering only changes how many nodes it takes"""
+        g = JanggiGame()
+        for move in [('g7', 'g6'), ('a4', 'b4'), ('a7', 'b7'), ('a1', 'a8'), ('b10', 'd7')]:
+            g.make_move(*move)
+        board = g._board
+        search = Search(board)
+        search._killers = [[None, None]]
+        moves = list(board.generate_legal_moves('red'))
+        quiet = moves[-1]
+        search.order_moves(moves, 'red', 0, quiet)
+        self.assertEqual(moves[:4], [quiet] + [(space_index(curr_space), space_index(new_space)) for curr_space, new_space
+                                               in [('a8', 'a10'), ('a8', 'b8'), ('b3', 'b7')]])
+        unordered = Search(board, ordering=False).run('red', None, 3)
+        ordered = Search(board).run('red', None, 3)
+        self.assertEqual(ordered['score'], unordered['score'])
+        self.assertLess(ordered['nodes'], unordered['nodes'])
+        self.assertGreater(ordered['first_move_cutoffs'] / ordered['cutoffs'],
+                           unordered['first_move_cutoffs'] / unordered['cutoffs'])
+
+    def test_stats(self):
+        """instrumentation counts calls only while it's enabled and puts the plain methods back afterwards"""
+        make = Board.make
+        reset_stats()
+        enable_stats()
+        try:
+            g = JanggiGame()
+            g.make_move('c7', 'c6')
+            g.make_move('c1', 'c2')
+            g.is_in_check('red')
+            stats = g.stats()
+        finally:
+            disable_stats()
+        self.assertIs(Board.make, make)
+        self.assertEqual(stats['make_move']['calls'], 2)
+        self.assertEqual(stats['is_in_check']['calls'], 1)
+        self.assertIn('Soldier.get_legal_moves', stats)
+        self.assertNotIn('Chariot.get_legal_moves', stats)
+        g.make_move('c1', 'd3')
+        self.assertEqual(get_stats(), stats)
+        reset_stats()
+        self.assertEqual(get_stats(), {})
+
+    def test_event_sink(self):
+        """make_move reports accepted and rejected moves, checks and the end of the game to its sink"""
+        class Recorder(EventSink):
+            def __init__(self):
+                self.events = []
+            def move_accepted(self, game, current_space, new_space):
+                self.events.append(('accepted', current_space, new_space))
+            def move_rejected(self, game, current_space, new_space, reason):
+                self.events.append(('rejected', current_space, new_space, reason))
+            def check(self, game, color):
+                self.events.append(('check', color))
+            def game_over(self, game, game_state):
+                self.events.append(('game over', game_state))
+        recorder = Recorder()
+        g = JanggiGame(sink=recorder)
+        g.make_move('c7', 'c6')
+        g.make_move('c7', 'c5')
+        g.make_move('c4', 'c3')
+        self.assertEqual(recorder.events, [('accepted', 'c7', 'c6'), ('rejected', 'c7', 'c5', 'NOT_YOUR_PIECE'),
+                                           ('rejected', 'c4', 'c3', 'ILLEGAL_MOVE')])
+        for move in [('c1', 'd3'), ('b10', 'd7'), ('b3', 'b3'), ('c10', 'd8'), ('h1', 'g3'), ('e7', 'e6'),
+                     ('b3', 'b3'), ('e6', 'f6'), ('b3', 'b3'), ('h8', 'c8'), ('d3', 'e5'), ('c8', 'c4'), ('e5', 'c4'),
+                     ('i10', 'i8'), ('g4', 'f4'), ('i8', 'f8'), ('g3', 'h5'), ('h10', 'g8'), ('d1', 'd2'),
+                     ('e9', 'e9'), ('d2', 'd3'), ('e9', 'e9'), ('b3', 'e3'), ('e9', 'e9')]:
+            g.make_move(*move)
+        self.assertEqual(recorder.events[-3:], [('accepted', 'b3', 'e3'), ('check', 'blue'),
+                                                ('rejected', 'e9', 'e9', 'PASS_IN_CHECK')])
+        g = JanggiGame(sink=recorder)
+        for move in [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('c10', 'd8'), ('h1', 'g3'),
+                     ('e7', 'e6'), ('e3', 'e6'), ('h8', 'c8'), ('d3', 'e5'), ('c8', 'c4'), ('e5', 'c4'),
+                     ('i10', 'i8'), ('g4', 'f4'), ('i8', 'f8'), ('g3', 'h5'), ('h10', 'g8'), ('e6', 'e3'),
+                     ('e9', 'd9'), ('c4', 'e5'), ('c6', 'd6'), ('e5', 'c4'), ('a7', 'a6'), ('h3', 'h9'),
+                     ('a10', 'a7'), ('c4', 'd6'), ('a6', 'b6'), ('h5', 'g7'), ('b8', 'b1'), ('a1', 'b1'),
+                     ('a7', 'a4'), ('b1', 'c1'), ('a4', 'a2'), ('e2', 'e1'), ('i7', 'h7'), ('c1', 'c9'),
+                     ('d9', 'e9')]:
+            g.make_move(*move)
+        self.assertEqual(recorder.events[-3:], [('accepted', 'c1', 'c9'), ('game over', 'RED_WON'),
+                                                ('rejected', 'd9', 'e9', 'GAME_OVER')])
+
+    def test_console_sink(self):
+        """the console sink holds back batch_size events and renders the board once per batch"""
+        stream = io.StringIO()
+        sink = ConsoleSink(stream, batch_size=10)
+        g = JanggiGame(sink=sink)
+        g.make_move('c7', 'c6')
+        g.make_move('c1', 'd3')
+        g.make_move('c1', 'c2')
+        self.assertEqual(stream.getvalue(), '')
+        sink.flush()
+        self.assertEqual(stream.getvalue(),
+                         'c7 c6\nc1 d3\nc1 c2\nno piece there or not your turn\n' + format_board(g._board) + '\n')
+
+class TestBoard(unittest.TestCase):
+
+    def play(self, board, moves):
+        for curr_space, new_space in moves:
+            board.get_piece(space_index(curr_space)).move(space_index(new_space)).commit()
+
+    def assert_is_attacked_matches(self, board):
+        for color in ("blue", "red"):
+            expected = set()
+            for piece in board.get_pieces(color):
+                expected.update(piece.get_attacking_spaces())
+            self.assertEqual({space for space in range(90) if board.is_attacked(space, color)}, expected)
+
+    def test_is_attacked_after_commit_and_revert(self):
+        """is_attacked agrees with every piece's attacking spaces after commits, captures and reverts"""
+        board = Board()
+        self.assert_is_attacked_matches(board)
+        self.play(board, [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6'), ('h8', 'c8')])
+        self.assert_is_attacked_matches(board)
+        capture = board.get_piece(space_index('e3')).move(space_index('e6'))
+        capture.commit()
+        self.assert_is_attacked_matches(board)
+        self.assertIs(board.is_attacked(space_index('e9'), 'red'), False)
+        capture.revert()
+        self.assert_is_attacked_matches(board)
+
+    def test_attackers_of(self):
+        """attackers_of finds a cannon through its screen and a horse through its open leg"""
+        board = Board()
+        self.play(board, [('b3', 'e5'), ('c1', 'f7')])
+        self.assertEqual(sorted(board.attackers_of(space_index('e9'), 'red')), [space_index('e5'), space_index('f7')])
+        self.play(board, [('f10', 'f8')])
+        self.assertEqual(board.attackers_of(space_index('e9'), 'red'), [space_index('e5')])
+        self.assertEqual(sorted(board.attackers_of(space_index('e8'), 'blue')), [space_index('f8'), space_index('h8')])
+
+    def test_check_evasions(self):
+        """a general with no safe step isn't mated while the check can be blocked or the checker captured"""
+        board = Board()
+        self.play(board, [('d10', 'd9'), ('f10', 'f9'), ('c10', 'd10'), ('g10', 'f10'), ('b10', 'e10'), ('b8', 'b6'),
+                          ('a1', 'a8'), ('c1', 'd7')])
+        general = board.get_general('blue')
+        self.assertIs(general.in_check(), True)
+        self.assertEqual(general.get_legal_moves(), [])
+        self.assertEqual(sorted(board.generate_evasions('blue')),
+                         sorted([(space_index('c7'), space_index('d7')), (space_index('e7'), space_index('d7')),
+                                 (space_index('d9'), space_index('d8'))]))
+        self.assertIs(general.in_checkmate(), False)
+        self.assertEqual(list(board.generate_evasions('red')), [])
+
+    def test_null_move_and_late_move_reductions(self):
+        """both prunings cut nodes and a reduction of 0 turns them off"""
+        board = Board()
+        self.play(board, [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6')])
+        plain = Search(board, null_move_reduction=0, late_move_reduction=0).run('red', None, 4)
+        self.assertEqual((plain['null_move_cutoffs'], plain['reduced_moves']), (0, 0))
+        pruned = Search(board).run('red', None, 4)
+        self.assertGreater(pruned['null_move_cutoffs'], 0)
+        self.assertGreater(pruned['reduced_moves'], 0)
+        self.assertLess(pruned['nodes'], plain['nodes'])
+
+    def test_incremental_evaluation(self):
+        """the running scores and point counts match a recount after moves, captures and unmakes"""
+        def recount(board):
+            scores, points = {}, {}
+            for color in ('blue', 'red'):
+                pieces = board.get_pieces(color) + [board.get_general(color)]
+                scores[color] = sum(EVAL_TABLES[type(piece), color][piece.space] for piece in pieces)
+                points[color] = sum(PIECE_POINTS[type(piece)] for piece in pieces)
+            return scores, points
+        board = Board()
+        self.assertEqual((board.point_count('blue'), board.point_count('red')), (72, 73.5))
+        self.assertEqual(board.evaluate('blue'), 0)
+        self.play(board, [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6'), ('e3', 'e6')])
+        self.assertEqual((board.scores, board.points), recount(board))
+        self.assertEqual((board.point_count('blue'), board.point_count('red')), (70, 73.5))
+        board.make(encode_move(space_index('h8'), space_index('h3')))
+        self.assertEqual(board.point_count('red'), 66.5)
+        self.assertEqual(board.evaluate('blue'), -board.evaluate('red'))
+        board.unmake()
+        self.assertEqual((board.scores, board.points), recount(board))
+        # the tables are mirrored: a soldier that crossed the river is worth the same to either side
+        self.assertEqual(EVAL_TABLES[Soldier, 'red'][space_index('e7')], EVAL_TABLES[Soldier, 'blue'][space_index('e4')])
+
+    def test_static_exchange(self):
+        """the exchange is played out, so a cannon only joins in once its screen is there"""
+        capture = encode_move(space_index('d4'), space_index('d6'))
+        board = Board()
+        self.play(board, [('b3', 'd2'), ('a1', 'd4'), ('c10', 'd6'), ('a10', 'd9')])
+        key = board.zobrist_key
+        # the chariot was the cannon's screen, so nothing recaptures for red after d9xd6
+        self.assertEqual(board.static_exchange(capture), 500 - 1300)
+        self.assertEqual(board.zobrist_key, key)
+        board = Board()
+        self.play(board, [('b3', 'd2'), ('a1', 'd4'), ('c10', 'd6'), ('a10', 'd9'), ('c4', 'd3')])
+        self.assertEqual(board.static_exchange(capture), 500)
+        self.assertEqual(board.least_valuable_attacker(space_index('d6'), 'red'), space_index('d4'))
+
+    def test_quiescence(self):
+        """at the horizon the search sees the recapture and leaves a defended horse alone"""
+        board = Board()
+        self.play(board, [('a1', 'd4'), ('c10', 'd6'), ('a10', 'd9')])
+        grab = (space_index('d4'), space_index('d6'))
+        self.assertEqual(Search(board, quiescence=False).run('red', None, 1)['move'], grab)
+        result = Search(board).run('red', None, 1)
+        self.assertNotEqual(result['move'], grab)
+        self.assertLess(result['score'], 100)
+        self.assertGreater(result['quiescence_nodes'], 0)
+        # the sides can keep checking each other out of check, quiescence still ends
+        g = JanggiGame.from_fen('9/4ak3/9/9/9/9/3r1p3/4K1n2/3A1C3/4RA3 b - - 0 1')
+        key = g.position_key()
+        self.assertLess(Search(g._board)._quiesce('red', 450, 460, 0), 460)
+        self.assertEqual(g.position_key(), key)
+
+    def test_make_and_unmake_restore_the_position(self):
+        """unmake takes back captures and passes, including the key and the order of the piece lists"""
+        board = Board()
+        self.play(board, [('c7', 'c6'), ('c1', 'd3'), ('b10', 'd7'), ('b3', 'e3'), ('e7', 'e6')])
+        spaces, key = list(board.spaces), board.zobrist_key
+        red_pieces = list(board.get_pieces('red'))
+        moves = [encode_move(space_index('e3'), space_index('e6')), PASS_MOVE,
+                 encode_move(space_index('d7'), space_index('b4'))]
+        for move in moves:
+            board.make(move)
+        self.assertEqual(board.last_move(), moves[2])
+        self.assertNotEqual(board.zobrist_key, key)
+        for _ in range(3):
+            board.unmake()
+        self.assertEqual(board.spaces, spaces)
+        self.assertEqual(board.zobrist_key, key)
+        self.assertEqual(board.get_pieces('red'), red_pieces)
+        self.assertEqual(board.get_piece(space_index('e3')).space, space_index('e3'))
+        self.assert_is_attacked_matches(board)
+        # a search full of captures leaves both piece lists as it found them
+        pieces = {color: list(board.get_pieces(color)) for color in ('blue', 'red')}
+        board.perft('blue', 3, bulk=False)
+        self.assertEqual({color: board.get_pieces(color) for color in ('blue', 'red')}, pieces)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,204 @@
+# Batch validation of Janggi game archives.
+#
+# Replays every game of an archive (see JanggiGame.replay) in a pool of processes and reports each game's outcome
+# and the throughput:
+#
+#     python validate.py ARCHIVE [--workers N] [--chunk-size N] [--unordered] [--output FILE] [--summary-only]
+#
+# An archive is a JSON Lines file with one game per line, either a list of moves or an object with "moves" and
+# optionally "id" and "fen" (the starting position, see parse_fen). A move is a [current_space, new_space] pair or a
+# string parse_move reads. Binary record files (see records.py) and .gib files (see gib.py) work too. Games are sent
+# to the workers chunk_size at a time, with only a few chunks in flight, so the archive is streamed and never held in
+# memory. Per-game results are written as JSON Lines, in archive order unless --unordered lets them out as soon as
+# their chunk is done; the summary goes to stderr.
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+import gib
+import records
+from JanggiGame import JanggiGame, FenError
+
+# chunks in flight per worker: enough to keep every worker busy while the results of another chunk come back
+CHUNKS_PER_WORKER = 2
+
+
+def read_archive(path: str):
+    """Yields the games of a JSON Lines archive one at a time, as dicts with "moves" (and "id" or "fen" if the
+    archive has them). Blank lines are skipped and a line that isn't JSON comes out as a game with just an "error", so
+    one bad line doesn't stop the rest. Binary record files (see records.py) and .gib files (see gib.py) are read as
+    well.
+    Args:
+        path: str
+    Returns: generator"""
+    if path.lower().endswith(".gib"):
+        yield from gib.read_gib(path)
+        return
+    if records.is_record_file(path):
+        yield from records.unpack(path)
+        return
+    with open(path) as archive:
+        for number, line in enumerate(archive, 1):
+            if not line.strip():
+                continue
+            try:
+                game = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield {"error": f"line {number} is not JSON: {error}"}
+                continue
+            yield game if isinstance(game, dict) else {"moves": game}
+
+
+def validate_game(game: dict):
+    """Replays one game from its starting position
+    Args:
+        game: dict
+    Returns: dict with the game's id, its state after the last move played, the plies played, the ply (from 0),
+        move and reason of the first refused move (see JanggiGame.replay), and an error for a bad starting position
+        (or the error the archive reader gave the game), or for a "fen" that isn't a string or "moves" that aren't a
+        list"""
+    result = {"id": game.get("id"), "game_state": None, "plies": 0, "illegal_ply": None, "illegal_move": None,
+              "reason": None, "error": game.get("error")}
+    if result["error"] is not None:
+        return result
+    fen = game.get("fen")
+    moves = game.get("moves", ())
+    if fen is not None and not isinstance(fen, str):
+        result["error"] = f"{fen!r} is not a FEN"
+        return result
+    # a string or a dict would be replayed a character or a key at a time
+    if isinstance(moves, (str, bytes, dict)) or not hasattr(moves, "__iter__"):
+        result["error"] = f"{moves!r} is not a list of moves"
+        return result
+    try:
+        replayed = JanggiGame(fen=fen).replay(moves)
+    except FenError as error:
+        result["error"] = str(error)
+        return result
+    result.update(replayed)
+    # a pair as a list, the way JSON gives it back; anything else an archive had in place of a move stays as it was
+    if isinstance(result["illegal_move"], tuple):
+        result["illegal_move"] = list(result["illegal_move"])
+    return result
+
+
+def _validate_chunk(chunk):
+    """Validates a chunk of (index, game) pairs in a worker
+    Returns: list of (index, result)"""
+    return [(index, validate_game(game)) for index, game in chunk]
+
+
+def validate_games(games, workers: int = None, chunk_size: int = 256, ordered: bool = True):
+    """Validates games (any iterable of game dicts, see read_archive) in a pool of workers processes, one per CPU by
+    default; with one worker everything runs in this process. Yields (index, result) for each game (see
+    validate_game), in the order of games, or, when ordered is False, chunk by chunk as the workers finish them.
+    Args:
+        games: iterable of dict
+        workers: int | None
+        chunk_size: int
+        ordered: bool
+    Returns: generator"""
+    workers = workers or os.cpu_count() or 1
+    games = enumerate(games)
+    if workers == 1:
+        for index, game in games:
+            yield index, validate_game(game)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque() if ordered else set()
+
+        def submit():
+            chunk = list(islice(games, chunk_size))
+            if chunk:
+                future = pool.submit(_validate_chunk, chunk)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+            return bool(chunk)
+
+        for _ in range(workers * CHUNKS_PER_WORKER):
+            if not submit():
+                break
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+            for future in done:
+                submit()
+                yield from future.result()
+
+
+def validate_archive(path: str, workers: int = None, chunk_size: int = 256, ordered: bool = True, output=None):
+    """Validates every game of an archive (see validate_games), writing each result to output as a JSON line if
+    output is given
+    Args:
+        path: str
+        workers: int | None
+        chunk_size: int
+        ordered: bool
+        output: file-like object | None
+    Returns: dict with the number of games, how many replayed to the end, how many had a refused move or a bad
+        starting position, the count of each final game state, the workers, seconds and games per second"""
+    workers = workers or os.cpu_count() or 1
+    summary = {"games": 0, "valid": 0, "illegal": 0, "errors": 0, "game_states": {}}
+    start = time.perf_counter()
+    for index, result in validate_games(read_archive(path), workers, chunk_size, ordered):
+        summary["games"] += 1
+        if result["error"] is not None:
+            summary["errors"] += 1
+        else:
+            if result["illegal_ply"] is not None:
+                summary["illegal"] += 1
+            else:
+                summary["valid"] += 1
+            states = summary["game_states"]
+            states[result["game_state"]] = states.get(result["game_state"], 0) + 1
+        if output is not None:
+            output.write(json.dumps(dict(result, index=index)) + "\n")
+    seconds = time.perf_counter() - start
+    summary["workers"] = workers
+    summary["seconds"] = round(seconds, 3)
+    summary["games_per_second"] = round(summary["games"] / seconds, 1) if seconds else None
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay every game of a JSON Lines archive and report the outcomes.")
+    parser.add_argument("archive", help="JSON Lines game archive")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="games sent to a worker at a time (default: 256)")
+    parser.add_argument("--unordered", action="store_true", help="write results as chunks finish, not in order")
+    parser.add_argument("--output", help="write the per-game results here instead of stdout")
+    parser.add_argument("--summary-only", action="store_true", help="don't write per-game results")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.summary_only:
+        output = None
+    elif options.output:
+        output = open(options.output, "w")
+    else:
+        output = sys.stdout
+    try:
+        summary = validate_archive(options.archive, options.workers, options.chunk_size, not options.unordered,
+                                   output)
+    finally:
+        if options.output and output is not None:
+            output.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["illegal"] or summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())